@@ -0,0 +1,228 @@
+"""
+Daemon de alertas H4 independiente de Streamlit.
+
+Evalúa la regla de cruce de EMAs y la señal de entrada para una lista de
+símbolos justo después de cada cierre H4 y guarda el estado en un único
+fichero (`estado_alertas.json`), que el dashboard lee en modo solo lectura.
+
+    python alert_daemon.py --symbols GC=F:ORO SI=F:PLATA
+    python alert_daemon.py --una-vez
+    python alert_daemon.py --streaming    # además, cruces en la H4 en formación
+
+Con --streaming los precios del websocket actualizan la barra en formación
+(ver streaming.py) y los cruces se avisan en segundos; el sondeo sigue
+siendo uno por cierre H4.
+
+El token y el chat de Telegram se toman de TELEGRAM_TOKEN / TELEGRAM_CHAT_ID
+o de los argumentos --token / --chat-id.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import pandas as pd
+
+from alertas import RUTA_ESTADO_DAEMON, NotificadorTelegram, guardar_estado_daemon, leer_estado_daemon, mensaje_cruce
+from diario import PARAMS_SEÑAL, RUTA_DIARIO, Diario, clave_params
+from datos import cargar_en_paralelo, duracion_periodo, obtener_barras, obtener_proveedor
+from indicadores import MotorIndicadores, calcular_adr, evaluar_senal
+from temporalidades import RemuestreoSesion, etiquetas
+
+BARRA_H4 = pd.Timedelta("4h")
+PERIODO_BASE = "6mo"
+
+log = logging.getLogger("alert_daemon")
+
+
+def proximo_cierre_h4(ahora):
+    """Cierre de la H4 en curso (alineada con la sesión de futuros)."""
+    # Se suma en hora local: en los cambios de horario la barra no dura 4h reales
+    inicio = etiquetas(pd.DatetimeIndex([ahora]), "H4")[0]
+    return (inicio.tz_localize(None) + BARRA_H4).tz_localize(inicio.tz, ambiguous=True,
+                                                             nonexistent="shift_forward")
+
+
+def notificar_una_vez(diario, params_cruce, notificador, chat_id, texto, clave=None, origen="daemon"):
+    """
+    Envía `texto` si el diario no tenía ya la alerta `clave` ('symbol:tipo:barra').
+    Sin notificador solo se anota en el log. Devuelve si se ha encolado.
+    """
+    if clave is not None:
+        symbol, tipo, barra = clave.split(":", 2)
+        # Una sola vez aunque el proceso se reinicie o el daemon/streaming ya la haya avisado
+        if not diario.registrar(symbol, "alerta", barra, tipo, params_cruce, origen=origen):
+            return False
+    if notificador is None:
+        log.info("Telegram no configurado: %s", texto.splitlines()[0])
+        return False
+    return notificador.enviar(chat_id, texto, clave)
+
+
+class DaemonAlertas:
+    def __init__(self, symbols, params, ruta_estado=RUTA_ESTADO_DAEMON, token=None, chat_id=None,
+                 cargar=obtener_barras, ruta_diario=RUTA_DIARIO):
+        self.symbols = symbols
+        self.cargar = cargar
+        self.params = params
+        self.params_cruce = clave_params(params["ema_fast"], params["ema_slow"], params["lrs_period"])
+        self.params_senal = clave_params(*(params[k] for k in PARAMS_SEÑAL))
+        # Cruces, señales y alertas enviadas: sobreviven a los reinicios
+        self.diario = Diario(ruta_diario)
+        self.ruta_estado = ruta_estado
+        self.chat_id = chat_id
+        self.notificador = NotificadorTelegram(token) if token and chat_id else None
+        self.remuestreo = RemuestreoSesion()
+        self.motor = MotorIndicadores()
+        # Últimas H4 de cada símbolo, para sembrar la ingesta en streaming
+        self.h4 = {}
+        self.estado = leer_estado_daemon(ruta_estado) or {}
+        if self.estado.get("params") != params:
+            # Con otros parámetros las EMAs previas no son comparables
+            self.estado = {"params": params, "simbolos": {}}
+
+    def notificar(self, texto, clave=None):
+        return notificar_una_vez(self.diario, self.params_cruce, self.notificador, self.chat_id, texto, clave)
+
+    def ciclo(self, ahora=None):
+        ahora = ahora or obtener_proveedor().ahora()
+        # Una sola serie base de 1h por símbolo: H4 y D1 salen del remuestreo
+        peticiones = {symbol: (symbol, "1h", PERIODO_BASE) for symbol in self.symbols}
+        datos, errores = cargar_en_paralelo(peticiones, cargar=self.cargar)
+        for symbol, error in errores.items():
+            log.error("Error descargando %s: %s", symbol, error)
+
+        for symbol, label in self.symbols.items():
+            if symbol not in datos:
+                continue
+            try:
+                marcos = self.remuestreo.actualizar(symbol, datos[symbol])
+                if marcos is None:
+                    continue
+                self.evaluar(symbol, label, marcos["H4"], marcos["D1"], ahora)
+            except Exception as e:
+                log.exception("Error evaluando %s: %s", label, e)
+
+        self.estado["actualizado"] = ahora.isoformat()
+        guardar_estado_daemon(self.estado, self.ruta_estado)
+
+    def evaluar(self, symbol, label, df_h4, df_d, ahora):
+        p = self.params
+        df_h4 = self.motor.actualizar(symbol, df_h4, p["ema_fast"], p["ema_slow"], p["lrs_period"])
+        if df_h4 is None:
+            return
+        self.h4[symbol] = df_h4
+        cerradas = df_h4[df_h4.index + BARRA_H4 <= ahora]
+        if len(cerradas) < 2:
+            return
+
+        barra = cerradas.index[-1].isoformat()
+        previo = self.estado["simbolos"].get(symbol)
+        if previo and previo["barra"] == barra:
+            return
+
+        df_d = df_d[df_d.index >= df_d.index[-1] - duracion_periodo("3mo")]
+        # Consumo con el rango de la sesión hasta la barra cerrada (como en el backtest)
+        ultimas = cerradas.iloc[-6:]
+        dias = etiquetas(ultimas.index, "D1")
+        sesion = ultimas[dias == dias[-1]]
+        senal = evaluar_senal(cerradas, calcular_adr(df_d, p["adr_period"]),
+                              p["min_ema_dist"], p["min_ema_slope"], p["max_adr_use"],
+                              rango=float(sesion["High"].max() - sesion["Low"].min()))
+        actual = {
+            "label": label,
+            "barra": barra,
+            "ema_rapida": senal["ema5"],
+            "ema_lenta": senal["ema15"],
+            "close": senal["close"],
+            "lrs": senal["lrs"],
+            "señal": senal["señal"],
+            "consumo_adr": senal["consumo_adr"],
+            "ultimo_cruce": previo.get("ultimo_cruce") if previo else None,
+        }
+
+        # Cruces de las barras cerradas desde la última revisión (también los de una parada)
+        for cruce in self.diario.sincronizar_cruces(symbol, cerradas, self.params_cruce, origen="daemon"):
+            tipo = cruce["valor"]
+            barra_cruce = cruce["barra"].tz_convert(cerradas.index.tz).isoformat()
+            self.notificar(mensaje_cruce(tipo, label, cruce["precio"], p["ema_fast"], p["ema_slow"], p["lrs_period"],
+                                         cruce["lrs"] or 0.0), clave=f"{symbol}:{tipo}:{barra_cruce}")
+            actual["ultimo_cruce"] = {"tipo": tipo, "barra": barra_cruce, "precio": cruce["precio"]}
+            log.info("Cruce %s en %s (%s)", tipo, label, barra_cruce)
+        if self.diario.registrar_senal(symbol, cerradas.index[-1], senal["señal"], self.params_senal,
+                                       precio=senal["close"], origen="daemon") and previo:
+            log.info("Señal %s: %s -> %s", label, previo.get("señal"), senal["señal"])
+
+        self.estado["simbolos"][symbol] = actual
+
+    def ejecutar(self, retraso=60):
+        while True:
+            self.ciclo()
+            ahora = pd.Timestamp.now(tz="UTC")
+            siguiente = proximo_cierre_h4(ahora) + pd.Timedelta(seconds=retraso)
+            log.info("Próximo ciclo: %s", siguiente)
+            time.sleep(max(0.0, (siguiente - ahora).total_seconds()))
+
+    async def ejecutar_streaming(self, ingesta, retraso=60):
+        """Como `ejecutar`, con `ingesta` (IngestaStreaming) avisando de los cruces dentro de la barra."""
+        tarea = asyncio.create_task(ingesta.ejecutar())
+        while not tarea.done():
+            await asyncio.to_thread(self.ciclo)
+            # Las barras cerradas oficiales corrigen lo acumulado con los ticks
+            for symbol, df_h4 in self.h4.items():
+                ingesta.sembrar(symbol, df_h4)
+            ahora = pd.Timestamp.now(tz="UTC")
+            siguiente = proximo_cierre_h4(ahora) + pd.Timedelta(seconds=retraso)
+            log.info("Próximo ciclo: %s", siguiente)
+            await asyncio.wait([tarea], timeout=max(0.0, (siguiente - ahora).total_seconds()))
+        tarea.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daemon de alertas H4 (cruces de EMAs)")
+    parser.add_argument("--symbols", nargs="+", default=["GC=F:ORO", "SI=F:PLATA"],
+                        help="Lista SYMBOL:ETIQUETA")
+    parser.add_argument("--adr-period", type=int, default=14)
+    parser.add_argument("--ema-fast", type=int, default=5)
+    parser.add_argument("--ema-slow", type=int, default=15)
+    parser.add_argument("--lrs-period", type=int, default=9)
+    parser.add_argument("--min-ema-dist", type=float, default=0.10)
+    parser.add_argument("--min-ema-slope", type=float, default=0.03)
+    parser.add_argument("--max-adr-use", type=float, default=0.60)
+    parser.add_argument("--estado", default=RUTA_ESTADO_DAEMON, help="Fichero de estado compartido")
+    parser.add_argument("--token", default=os.environ.get("TELEGRAM_TOKEN"))
+    parser.add_argument("--chat-id", default=os.environ.get("TELEGRAM_CHAT_ID"))
+    parser.add_argument("--retraso", type=int, default=60,
+                        help="Segundos tras el cierre H4 antes de evaluar")
+    parser.add_argument("--una-vez", action="store_true", help="Un solo ciclo y salir")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Avisar también de los cruces en la H4 en formación (websocket de Yahoo)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    symbols = dict(s.split(":", 1) if ":" in s else (s, s) for s in args.symbols)
+    params = {
+        "adr_period": args.adr_period,
+        "ema_fast": args.ema_fast,
+        "ema_slow": args.ema_slow,
+        "lrs_period": args.lrs_period,
+        "min_ema_dist": args.min_ema_dist,
+        "min_ema_slope": args.min_ema_slope,
+        "max_adr_use": args.max_adr_use,
+    }
+    daemon = DaemonAlertas(symbols, params, args.estado, args.token, args.chat_id)
+    if args.una_vez:
+        daemon.ciclo()
+        if daemon.notificador:
+            daemon.notificador.esperar(timeout=60)
+    elif args.streaming:
+        from streaming import FeedYahoo, IngestaStreaming
+        ingesta = IngestaStreaming(FeedYahoo(), symbols, params, notificar=daemon.notificar)
+        asyncio.run(daemon.ejecutar_streaming(ingesta, args.retraso))
+    else:
+        daemon.ejecutar(args.retraso)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import pandas as pd
+import requests
+
+from metricas import medir
+
+TELEGRAM_API = "https://api.telegram.org"
+RUTA_ESTADO_DAEMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "estado_alertas.json")
+
+log = logging.getLogger("alertas")
+
+
+class NotificadorTelegram:
+    """
+    Envío de mensajes de Telegram en segundo plano.
+
+    `enviar` solo encola (cola acotada, nunca bloquea). Un hilo de fondo
+    consume la cola con una sesión HTTP reutilizada, timeout por petición,
+    reintentos con espera exponencial (respetando `retry_after` en los 429)
+    y un intervalo mínimo entre mensajes al mismo chat. Los mensajes con la
+    misma clave (por defecto el texto) dentro de `ventana_dedup` se descartan.
+    """
+
+    def __init__(self, token, base_url=TELEGRAM_API, max_cola=100, timeout=10, reintentos=4,
+                 espera_base=1.0, intervalo_chat=1.0, ventana_dedup=4 * 3600):
+        self.url = f"{base_url}/bot{token}/sendMessage"
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.intervalo_chat = intervalo_chat
+        self.ventana_dedup = ventana_dedup
+
+        self.sesion = requests.Session()
+        self.sesion.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.sesion.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._lock = threading.Lock()
+        self._vistos = {}
+        self._ultimo_envio = {}
+        self.estadisticas = {"enviados": 0, "fallidos": 0, "duplicados": 0, "descartados": 0, "ultimo_error": None}
+        self._hilo = threading.Thread(target=self._bucle, name="notificador-telegram", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, chat_id, texto, clave=None):
+        """Encola un mensaje. Devuelve False si es duplicado o la cola está llena."""
+        ahora = time.monotonic()
+        clave = (chat_id, clave or texto)
+        with self._lock:
+            self._vistos = {k: t for k, t in self._vistos.items() if ahora - t < self.ventana_dedup}
+            if clave in self._vistos:
+                self.estadisticas["duplicados"] += 1
+                return False
+            try:
+                self._cola.put_nowait((chat_id, texto))
+            except queue.Full:
+                self.estadisticas["descartados"] += 1
+                return False
+            self._vistos[clave] = ahora
+        return True
+
+    def esperar(self, timeout=None):
+        """Espera a que se vacíe la cola (para procesos que van a terminar)."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while self._cola.unfinished_tasks:
+            if limite is not None and time.monotonic() >= limite:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _bucle(self):
+        while True:
+            chat_id, texto = self._cola.get()
+            try:
+                # Límite por chat
+                espera = self._ultimo_envio.get(chat_id, 0) + self.intervalo_chat - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+                with medir("telegram_envio"):
+                    self._entregar(chat_id, texto)
+                self._ultimo_envio[chat_id] = time.monotonic()
+            except Exception as e:
+                # Un fallo inesperado no puede parar el único hilo de envío: se anota y sigue con la cola
+                log.exception("Error enviando a Telegram: %s", e)
+                self.estadisticas["fallidos"] += 1
+                self.estadisticas["ultimo_error"] = f"{type(e).__name__}: {e}"
+            finally:
+                self._cola.task_done()
+
+    def _entregar(self, chat_id, texto):
+        payload = {"chat_id": chat_id, "text": texto, "parse_mode": "Markdown"}
+        for intento in range(self.reintentos + 1):
+            espera = self.espera_base * 2 ** intento
+            try:
+                r = self.sesion.post(self.url, json=payload, timeout=self.timeout)
+                if r.status_code == 200:
+                    self.estadisticas["enviados"] += 1
+                    return True
+                error = f"HTTP {r.status_code}"
+                if r.status_code == 429:
+                    try:
+                        espera = max(espera, r.json()["parameters"]["retry_after"])
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                elif r.status_code < 500:
+                    # Errores del cliente (token o chat inválidos): no tiene sentido reintentar
+                    break
+            except requests.RequestException as e:
+                error = str(e)
+            if intento < self.reintentos:
+                time.sleep(espera)
+        self.estadisticas["fallidos"] += 1
+        self.estadisticas["ultimo_error"] = error
+        return False
+
+
+def mensaje_cruce(tipo, label, close, ema_fast, ema_slow, lrs_period, lrs_val, en_formacion=False):
+    marco = "H4 en formación" if en_formacion else "H4"
+    if tipo == "alza":
+        return (f"🚀 *CRUCE AL ALZA {label} ({marco})*\nPrecio: ${close:.2f}\n"
+                f"EMA{ema_fast} ha cruzado por encima de EMA{ema_slow}\nLRS ({lrs_period}): {lrs_val:.4f}")
+    return (f"📉 *CRUCE A LA BAJA {label} ({marco})*\nPrecio: ${close:.2f}\n"
+            f"EMA{ema_fast} ha cruzado por debajo de EMA{ema_slow}\nLRS ({lrs_period}): {lrs_val:.4f}")
+
+
+# ================= ESTADO COMPARTIDO CON EL DAEMON =================
+def leer_estado_daemon(ruta=RUTA_ESTADO_DAEMON):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_estado_daemon(estado, ruta=RUTA_ESTADO_DAEMON):
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, ruta)
+
+
+def daemon_activo(estado, margen=pd.Timedelta("4h15min")):
+    """El daemon se da por activo si ha completado un ciclo dentro del último H4."""
+    if not estado or "actualizado" not in estado:
+        return False
+    return pd.Timestamp.now(tz="UTC") - pd.Timestamp(estado["actualizado"]) <= margen
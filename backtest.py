@@ -0,0 +1,238 @@
+"""
+Backtest histórico de la regla de señal H4 y barrido de parámetros.
+
+La regla es la de `evaluar_senal` (gap entre EMAs, pendiente de la EMA lenta
+y consumo del ADR) aplicada a todas las barras H4 cerradas con operaciones
+sobre arrays. Cada señal abre una operación con el modelo de la calculadora:
+stop a `stop_adr` ADRs, objetivo a `rr` veces el stop, y resultado +RR o -1 R
+según lo que toque antes (si ambos caen en la misma barra cuenta como
+pérdida). Sin resolver en `horizonte` barras se cierra a mercado. No se abre
+una operación nueva hasta cerrar la anterior.
+
+    python backtest.py --symbol GC=F
+    python backtest.py --symbol SI=F --rr 2 --top 30
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from indicadores import adr_periodos, true_range
+from temporalidades import agregar, etiquetas
+
+# Rejilla por defecto: los sliders de la barra lateral con pasos más gruesos
+REJILLA = {
+    "ema_fast": range(3, 11),
+    "ema_slow": (10, 15, 20, 25, 30),
+    "adr_period": (14,),
+    "min_ema_dist": (0.0, 0.05, 0.10, 0.20, 0.30),
+    "min_ema_slope": (0.0, 0.01, 0.03, 0.05),
+    "max_adr_use": (0.4, 0.6, 0.8, 1.0),
+}
+
+
+def barras_h4(df_1h):
+    """H4 cerradas a partir de barras de 1h (mismo remuestreo que el dashboard)."""
+    return agregar(df_1h, "H4")[0].iloc[:-1]
+
+
+def _dias(indice):
+    """Fecha de sesión (la D1) de cada barra."""
+    return etiquetas(indice, "D1").asi8
+
+
+def adr_previo(df_h4, df_d, periodos):
+    """{periodo: ADR (EWM del True Range) de los días completos anteriores a cada barra H4}."""
+    adr = adr_periodos(true_range(df_d), periodos)
+    # Último día diario estrictamente anterior al día de la barra (sin mirar al futuro)
+    pos = np.searchsorted(_dias(df_d.index), _dias(df_h4.index), side="left") - 1
+    return {p: np.where(pos >= 0, adr[np.maximum(pos, 0), i], np.nan) for i, p in enumerate(periodos)}
+
+
+def rango_sesion(df_h4):
+    """Máximo - mínimo de la sesión hasta cada barra (el consumo de ADR de ese momento)."""
+    dia = _dias(df_h4.index)
+    alto = df_h4["High"].groupby(dia).cummax().to_numpy()
+    bajo = df_h4["Low"].groupby(dia).cummin().to_numpy()
+    return alto - bajo
+
+
+def resultados_operaciones(high, low, close, distancia, rr, horizonte):
+    """
+    Resultado en R y barra de salida de una operación abierta al cierre de
+    cada barra, para largos y cortos. Se recorre el horizonte, no las barras.
+    """
+    n = len(close)
+    resultado = {}
+    for sentido in (1, -1):
+        objetivo = close + sentido * rr * distancia
+        stop = close - sentido * distancia
+        r = np.full(n, np.nan)
+        salida = np.minimum(np.arange(n) + horizonte, n - 1)
+        abiertas = ~np.isnan(distancia) & (distancia > 0)
+        for h in range(1, horizonte + 1):
+            j = np.arange(n) + h
+            validas = abiertas & (j < n)
+            if not validas.any():
+                break
+            jj = np.minimum(j, n - 1)
+            toca_stop = validas & ((low[jj] <= stop) if sentido == 1 else (high[jj] >= stop))
+            toca_obj = validas & ~toca_stop & ((high[jj] >= objetivo) if sentido == 1 else (low[jj] <= objetivo))
+            r[toca_stop], r[toca_obj] = -1.0, rr
+            salida[toca_stop | toca_obj] = j[toca_stop | toca_obj]
+            abiertas &= ~(toca_stop | toca_obj)
+        # Sin resolver: cierre a mercado en la barra de salida (la última barra no opera)
+        abiertas &= salida > np.arange(n)
+        r[abiertas] = (close[salida[abiertas]] - close[abiertas]) * sentido / distancia[abiertas]
+        resultado[sentido] = (r, salida)
+    return resultado
+
+
+def _encadenar(señal, r, salida):
+    """
+    Resultados en R de las operaciones sin solapamiento: tras cada salida se
+    salta a la primera barra con señal posterior. `r` y `salida` (listas) ya
+    corresponden al sentido de cada barra.
+    """
+    n = len(señal)
+    # siguiente[k]: primera barra con señal en k o después (n si no hay)
+    siguiente = np.minimum.accumulate(np.where(señal, np.arange(n), n)[::-1])[::-1].tolist() + [n]
+    rs = []
+    i = siguiente[0]
+    while i < n:
+        if r[i] == r[i]:  # NaN: sin ADR para calcular el stop
+            rs.append(r[i])
+            i = siguiente[salida[i] + 1]
+        else:
+            i = siguiente[i + 1]
+    return np.array(rs)
+
+
+def estadisticas(rs, riesgo_pct):
+    """Esperanza y drawdown (en R y en % del capital con riesgo fijo)."""
+    if len(rs) == 0:
+        return {"operaciones": 0, "win_rate": np.nan, "esperanza_r": np.nan, "total_r": 0.0,
+                "max_dd_r": 0.0, "max_dd_pct": 0.0}
+    equity = np.concatenate([[0.0], np.cumsum(rs)])
+    dd_r = float((np.maximum.accumulate(equity) - equity).max())
+    capital = 1 + equity * riesgo_pct / 100
+    dd_pct = float((1 - capital / np.maximum.accumulate(capital)).max() * 100)
+    return {
+        "operaciones": len(rs),
+        "win_rate": float((rs > 0).mean()),
+        "esperanza_r": float(rs.mean()),
+        "total_r": float(equity[-1]),
+        "max_dd_r": dd_r,
+        "max_dd_pct": dd_pct,
+    }
+
+
+# ================= EJECUCIÓN POR PROCESO =================
+_DATOS = None
+
+
+def _iniciar(datos):
+    global _DATOS
+    _DATOS = datos
+
+
+def _evaluar_grupo(ema_fast, ema_slow, adr_period, umbrales, rr, stop_adr, horizonte, riesgo_pct):
+    """Todas las combinaciones de umbrales para unas EMAs y un periodo ADR."""
+    d = _DATOS
+    close, ema_r, ema_l = d["close"], d["ema"][ema_fast], d["ema"][ema_slow]
+    adr = d["adr"][adr_period]
+
+    ema_dist_pct = np.abs(ema_r - ema_l) / close * 100
+    ema_slope_pct = np.abs(np.diff(ema_l, prepend=ema_l[0])) / close * 100
+    with np.errstate(invalid="ignore", divide="ignore"):
+        consumo = d["rango"] / adr
+    sentido = np.sign(ema_r - ema_l).astype(np.int64)
+    operaciones = resultados_operaciones(d["high"], d["low"], close, stop_adr * adr, rr, horizonte)
+    largo = sentido == 1
+    r = np.where(largo, operaciones[1][0], operaciones[-1][0]).tolist()
+    salida = np.where(largo, operaciones[1][1], operaciones[-1][1]).tolist()
+
+    filas = []
+    for dist, slope, uso in umbrales:
+        señal = (ema_dist_pct >= dist) & (ema_slope_pct >= slope) & (consumo <= uso) & (sentido != 0)
+        fila = {"ema_fast": ema_fast, "ema_slow": ema_slow, "adr_period": adr_period,
+                "min_ema_dist": dist, "min_ema_slope": slope, "max_adr_use": uso}
+        fila.update(estadisticas(_encadenar(señal, r, salida), riesgo_pct))
+        filas.append(fila)
+    return filas
+
+
+def _evaluar_grupo_args(args):
+    return _evaluar_grupo(*args)
+
+
+def barrido(df_h4, df_d, rejilla=REJILLA, rr=2.0, stop_adr=0.5, horizonte=30, riesgo_pct=1.0,
+            procesos=None):
+    """
+    Backtest de cada combinación de la rejilla. Las EMAs y el ADR se calculan
+    una vez por valor; cada proceso recibe un grupo (EMAs, periodo ADR) y
+    resuelve todas sus combinaciones de umbrales con máscaras de arrays.
+
+    Devuelve un DataFrame con una fila por combinación: operaciones, win_rate,
+    esperanza_r, total_r, max_dd_r y max_dd_pct.
+    """
+    cierres = df_h4["Close"]
+    spans = sorted(set(rejilla["ema_fast"]) | set(rejilla["ema_slow"]))
+    datos = {
+        "close": cierres.to_numpy(dtype=np.float64),
+        "high": df_h4["High"].to_numpy(dtype=np.float64),
+        "low": df_h4["Low"].to_numpy(dtype=np.float64),
+        "rango": rango_sesion(df_h4),
+        "ema": {s: cierres.ewm(span=s).mean().to_numpy() for s in spans},
+        "adr": adr_previo(df_h4, df_d, rejilla["adr_period"]),
+    }
+    umbrales = list(itertools.product(rejilla["min_ema_dist"], rejilla["min_ema_slope"], rejilla["max_adr_use"]))
+    grupos = [(f, s, p, umbrales, rr, stop_adr, horizonte, riesgo_pct)
+              for f, s, p in itertools.product(rejilla["ema_fast"], rejilla["ema_slow"], rejilla["adr_period"])
+              if f < s]
+
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1:
+        _iniciar(datos)
+        partes = [_evaluar_grupo(*g) for g in grupos]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar, initargs=(datos,)) as pool:
+            partes = list(pool.map(_evaluar_grupo_args, grupos, chunksize=max(1, len(grupos) // (procesos * 4))))
+    return pd.DataFrame([fila for parte in partes for fila in parte])
+
+
+def main():
+    from datos import obtener_barras
+
+    parser = argparse.ArgumentParser(description="Backtest y barrido de parámetros de la señal H4")
+    parser.add_argument("--symbol", default="GC=F")
+    parser.add_argument("--periodo", default="720d", help="Historia de 1h (Yahoo limita a ~730 días)")
+    parser.add_argument("--rr", type=float, default=2.0)
+    parser.add_argument("--stop-adr", type=float, default=0.5, help="Distancia del stop en ADRs")
+    parser.add_argument("--horizonte", type=int, default=30, help="Barras H4 máximas por operación")
+    parser.add_argument("--riesgo", type=float, default=1.0, help="Riesgo por operación (%% del capital)")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--min-operaciones", type=int, default=20)
+    parser.add_argument("--csv", help="Guardar todas las combinaciones en un CSV")
+    args = parser.parse_args()
+
+    df_1h = obtener_barras(args.symbol, "1h", args.periodo)
+    df_h4 = barras_h4(df_1h)
+    df_d = agregar(df_1h, "D1")[0]
+    t = pd.Timestamp.now()
+    res = barrido(df_h4, df_d, rr=args.rr, stop_adr=args.stop_adr, horizonte=args.horizonte,
+                  riesgo_pct=args.riesgo, procesos=args.procesos)
+    segundos = (pd.Timestamp.now() - t).total_seconds()
+    print(f"{len(res)} combinaciones sobre {len(df_h4)} barras H4 en {segundos:.1f}s")
+    if args.csv:
+        res.to_csv(args.csv, index=False)
+    mejores = res[res["operaciones"] >= args.min_operaciones].sort_values("esperanza_r", ascending=False)
+    print(mejores.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+# ================= CONFIG =================
+COLUMNAS = ("Open", "High", "Low", "Close", "Volume")
+
+
+class BarrasCompactas:
+    """
+    Barras de un símbolo en arrays contiguos de capacidad fija.
+
+    Cada columna es una fila de una matriz (columnas × 2·capacidad) y cada
+    barra se escribe en su posición y en la misma más `capacidad`: así las
+    barras guardadas ocupan siempre un tramo contiguo y `columna()` devuelve
+    una vista, sin copiar. Al llenarse se expulsan las más antiguas. La
+    memoria se reserva al crearla (`nbytes`) y no crece con la historia.
+
+    Las vistas apuntan al buffer: al añadir barras cambian, así que quien
+    quiera conservarlas debe copiarlas (`a_dataframe` copia).
+    """
+
+    def __init__(self, capacidad, columnas=COLUMNAS, dtype=np.float64, tz=None):
+        if capacidad < 1:
+            raise ValueError("La capacidad debe ser >= 1")
+        self.capacidad = int(capacidad)
+        self.columnas = tuple(columnas)
+        self.dtype = np.dtype(dtype)
+        self.tz = tz
+        self._posicion = {c: i for i, c in enumerate(self.columnas)}
+        self._valores = np.full((len(self.columnas), 2 * self.capacidad), np.nan, dtype=self.dtype)
+        self._tiempos = np.zeros(2 * self.capacidad, dtype=np.int64)  # ns UTC
+        # Barras añadidas desde la creación, incluidas las ya expulsadas
+        self.total = 0
+
+    @classmethod
+    def desde_dataframe(cls, df, capacidad, dtype=np.float64):
+        barras = cls(capacidad, columnas=df.columns, dtype=dtype, tz=getattr(df.index, "tz", None))
+        barras.añadir_df(df)
+        return barras
+
+    def __len__(self):
+        return min(self.total, self.capacidad)
+
+    @property
+    def nbytes(self):
+        return self._valores.nbytes + self._tiempos.nbytes
+
+    def _tramo(self):
+        n = len(self)
+        inicio = (self.total - n) % self.capacidad
+        return inicio, inicio + n
+
+    def añadir(self, tiempos, valores):
+        """`tiempos` en ns UTC y `valores` como matriz (columnas × barras), de la más antigua a la más nueva."""
+        tiempos = np.asarray(tiempos, dtype=np.int64)
+        valores = np.asarray(valores, dtype=self.dtype).reshape(len(self.columnas), len(tiempos))
+        m = len(tiempos)
+        if m > self.capacidad:
+            # Solo caben las últimas: las anteriores cuentan como expulsadas
+            self.total += m - self.capacidad
+            tiempos, valores, m = tiempos[-self.capacidad:], valores[:, -self.capacidad:], self.capacidad
+        posiciones = (self.total + np.arange(m)) % self.capacidad
+        for destino in (posiciones, posiciones + self.capacidad):
+            self._valores[:, destino] = valores
+            self._tiempos[destino] = tiempos
+        self.total += m
+
+    def añadir_df(self, df):
+        if not len(df):
+            return
+        matriz = np.vstack([df[c].to_numpy(dtype=self.dtype) for c in self.columnas])
+        self.añadir(df.index.as_unit("ns").asi8, matriz)
+
+    def columna(self, nombre):
+        """Vista (sin copia) de una columna, de la barra más antigua a la más nueva."""
+        inicio, fin = self._tramo()
+        return self._valores[self._posicion[nombre], inicio:fin]
+
+    def tiempos(self):
+        """Vista de los instantes en ns UTC."""
+        inicio, fin = self._tramo()
+        return self._tiempos[inicio:fin]
+
+    def indice(self):
+        indice = pd.DatetimeIndex(self.tiempos().view("datetime64[ns]"))
+        return indice.tz_localize("UTC").tz_convert(self.tz) if self.tz is not None else indice
+
+    def ultimo_instante(self):
+        if not len(self):
+            return None
+        instante = pd.Timestamp(int(self._tiempos[self._tramo()[1] - 1]), unit="ns")
+        return instante.tz_localize("UTC").tz_convert(self.tz) if self.tz is not None else instante
+
+    def ultima_fila(self):
+        """Valores de la última barra (vista), en el orden de `columnas`."""
+        return self._valores[:, self._tramo()[1] - 1]
+
+    def a_dataframe(self):
+        inicio, fin = self._tramo()
+        return pd.DataFrame(self._valores[:, inicio:fin].T.copy(), index=self.indice(), columns=list(self.columnas))
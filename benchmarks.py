@@ -0,0 +1,195 @@
+"""
+Benchmarks de las rutas de cálculo del dashboard, sin conexión.
+
+Genera OHLCV sintético de 1h (desde cientos hasta millones de barras) y mide
+cada etapa por separado y la cadena completa: remuestreo, EMAs, LRS, ADR,
+cruces, motor incremental, figura del monitor, escáner de 300 símbolos,
+Monte Carlo y ruina exacta.
+
+    python benchmarks.py                          # medir y comparar con la base
+    python benchmarks.py --guardar                # medir y guardar como base
+    python benchmarks.py --tamaños 1000 1000000 --etapas lrs remuestreo
+
+Una etapa se marca como regresión si su mediana supera la de la base en más
+de `--tolerancia` (25 % por defecto); en ese caso el proceso sale con código 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from graficos import cruces_emas, figura_monitor
+from indicadores import MotorIndicadores, adr_periodos, calcular_adr, calcular_lrs, true_range
+from riesgo import ruina_exacta, simular_montecarlo
+from scanner import PanelH4
+from temporalidades import MARCOS, TZ_SESION, agregar
+
+RUTA_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks_base.json")
+TAMAÑOS = (500, 5_000, 50_000, 500_000)
+
+
+def generar_ohlcv(n, seed=0, inicio="2000-01-02 18:00", precio=2000.0, volatilidad=0.002):
+    """
+    `n` barras de 1h con paseo aleatorio geométrico y horario de la sesión de
+    futuros (cierre diario de 17 a 18 y fin de semana de viernes 17:00 a
+    domingo 18:00, hora de Nueva York).
+    """
+    rng = np.random.default_rng(seed)
+    # Se generan horas de sobra y se descartan las de mercado cerrado
+    idx = pd.date_range(inicio, periods=int(n * 1.45) + 48, freq="1h")
+    dia, hora = idx.dayofweek, idx.hour
+    abierto = ~((hora == 17) | (dia == 5) | ((dia == 4) & (hora > 17)) | ((dia == 6) & (hora < 18)))
+    idx = idx[abierto][:n].tz_localize(TZ_SESION, ambiguous="NaT", nonexistent="NaT")
+    idx = idx[~idx.isna()]
+    n = len(idx)
+
+    cierre = precio * np.exp(np.cumsum(rng.normal(0, volatilidad, n)))
+    apertura = np.r_[precio, cierre[:-1]] * np.exp(rng.normal(0, volatilidad / 4, n))
+    rango = np.abs(rng.normal(0, volatilidad, (2, n))) * cierre
+    return pd.DataFrame({
+        "Open": apertura,
+        "High": np.maximum(apertura, cierre) + rango[0],
+        "Low": np.minimum(apertura, cierre) - rango[1],
+        "Close": cierre,
+        "Volume": rng.integers(1, 5_000, n).astype(np.float64),
+    }, index=idx)
+
+
+def _con_indicadores(df_h4, ema_fast=5, ema_slow=15, lrs_period=9):
+    df = df_h4.copy()
+    df["EMA5"] = df["Close"].ewm(span=ema_fast).mean()
+    df["EMA15"] = df["Close"].ewm(span=ema_slow).mean()
+    df["LRS"] = calcular_lrs(df["Close"].to_numpy(), lrs_period)
+    return df
+
+
+def _motor_incremental(base_h4, pasos=20):
+    """Motor ya calculado salvo las últimas `pasos` barras; cada llamada añade una."""
+    motor = MotorIndicadores()
+    motor.actualizar("X", base_h4.iloc[:-pasos], 5, 15, 9)
+    siguientes = iter(range(pasos - 1, -1, -1))
+
+    def paso():
+        k = next(siguientes)
+        motor.actualizar("X", base_h4.iloc[:len(base_h4) - k], 5, 15, 9)
+    return paso
+
+
+def etapas(base):
+    """{nombre: función sin argumentos}; lo que se prepara aquí no se mide."""
+    h4 = agregar(base, "H4")[0]
+    d1 = agregar(base, "D1")[0]
+    h4_ind = _con_indicadores(h4)
+    cierres = h4["Close"].to_numpy()
+    panel = PanelH4()
+    panel.actualizar({f"S{i}": {"H4": h4, "D1": d1} for i in range(300)})
+
+    def pipeline():
+        df_h4 = _con_indicadores(agregar(base, "H4")[0])
+        calcular_adr(agregar(base, "D1")[0].iloc[-66:], 14)
+        cruces_emas(df_h4)
+        figura_monitor(df_h4, 5, 15, 9).to_json()
+
+    return {
+        "remuestreo_h4": lambda: agregar(base, "H4"),
+        "remuestreo_todos": lambda: [agregar(base, m) for m in MARCOS],
+        "emas": lambda: (h4["Close"].ewm(span=5).mean(), h4["Close"].ewm(span=15).mean()),
+        "lrs": lambda: calcular_lrs(cierres, 9),
+        "adr": lambda: calcular_adr(d1, 14),
+        "adr_todos": lambda: adr_periodos(true_range(d1.iloc[-66:])),
+        "cruces": lambda: cruces_emas(h4_ind),
+        "motor_incremental": _motor_incremental(h4),
+        "grafico": lambda: figura_monitor(h4_ind, 5, 15, 9).to_json(),
+        "escaner_300": lambda: panel.evaluar(5, 15, 9, 14, 0.10, 0.03, 0.60),
+        "montecarlo": lambda: simular_montecarlo(10_000, 100, 2.0, 0.5, 100,
+                                                 n_paths=min(len(base), 100_000), seed=0),
+        "ruina_exacta": lambda: ruina_exacta(10_000, 100, 1.0, 0.5, 10_000),
+        "pipeline": pipeline,
+    }
+
+
+def medir(funcion, repeticiones=5, presupuesto=10.0):
+    """Mediana y mínimo (segundos); menos repeticiones si la etapa es lenta."""
+    tiempos = []
+    limite = time.perf_counter() + presupuesto
+    for _ in range(repeticiones):
+        t = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t)
+        if time.perf_counter() > limite:
+            break
+    return {"mediana": statistics.median(tiempos), "minimo": min(tiempos), "repeticiones": len(tiempos)}
+
+
+def ejecutar(tamaños=TAMAÑOS, seleccion=None, repeticiones=5):
+    resultados = {}
+    for n in tamaños:
+        base = generar_ohlcv(n)
+        for nombre, funcion in etapas(base).items():
+            if seleccion and nombre not in seleccion:
+                continue
+            r = medir(funcion, repeticiones)
+            resultados[f"{nombre}@{n}"] = r
+            print(f"{nombre:<20} {n:>10,} barras  {r['mediana'] * 1000:>10.2f} ms  (mín {r['minimo'] * 1000:.2f})")
+    return resultados
+
+
+def comparar(resultados, base, tolerancia=0.25):
+    """Lista de (clave, base, actual, ratio) de las etapas más lentas que la base."""
+    regresiones = []
+    for clave, r in resultados.items():
+        anterior = base.get("resultados", {}).get(clave)
+        if anterior is None:
+            continue
+        ratio = r["mediana"] / anterior["mediana"]
+        if ratio > 1 + tolerancia:
+            regresiones.append((clave, anterior["mediana"], r["mediana"], ratio))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline de las rutas de cálculo")
+    parser.add_argument("--tamaños", type=int, nargs="+", default=list(TAMAÑOS), help="Barras de 1h")
+    parser.add_argument("--etapas", nargs="+", help="Solo estas etapas")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Como mucho 20")
+    parser.add_argument("--base", default=RUTA_BASE, help="Fichero JSON de la base")
+    parser.add_argument("--guardar", action="store_true", help="Guardar los resultados como base")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args()
+
+    resultados = ejecutar(args.tamaños, args.etapas, min(args.repeticiones, 20))
+
+    if args.guardar:
+        base = {}
+        if os.path.exists(args.base):
+            with open(args.base, encoding="utf-8") as f:
+                base = json.load(f)
+        base.setdefault("resultados", {}).update(resultados)
+        base["entorno"] = {"python": platform.python_version(), "numpy": np.__version__,
+                           "pandas": pd.__version__, "cpus": os.cpu_count(), "maquina": platform.node()}
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump(base, f, indent=2)
+        print(f"Base guardada en {args.base}")
+        return
+
+    if not os.path.exists(args.base):
+        print("Sin base con la que comparar (usa --guardar)")
+        return
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    regresiones = comparar(resultados, base, args.tolerancia)
+    for clave, antes, ahora, ratio in regresiones:
+        print(f"REGRESIÓN {clave}: {antes * 1000:.2f} ms -> {ahora * 1000:.2f} ms (x{ratio:.2f})")
+    if regresiones:
+        sys.exit(1)
+    print("Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
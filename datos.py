@@ -0,0 +1,489 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from metricas import contar, medir
+
+# ================= CONFIG =================
+DIR_BARRAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".barras")
+COLUMNAS = ("Open", "High", "Low", "Close", "Volume")
+TTL_CACHE = {"1h": 60, "1d": 300}
+MAX_BYTES_CACHE = 256 * 1024 * 1024
+_LOCK_GLOBAL = threading.Lock()
+
+
+def _normalizar(df):
+    """Columnas simples OHLCV (yfinance devuelve MultiIndex con el ticker)."""
+    if df is None:
+        return pd.DataFrame(columns=list(COLUMNAS))
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    return df[[c for c in COLUMNAS if c in df.columns]].dropna(how="all").astype(np.float64)
+
+
+def descargar_yahoo(symbol, interval, period=None, start=None):
+    # yfinance (~0,3 s de importación) solo se carga con la primera descarga real
+    import yfinance as yf
+    with medir("descarga", symbol):
+        df = _normalizar(yf.download(symbol, period=period, start=start, interval=interval, progress=False))
+    # yfinance no expone los bytes de la respuesta: se cuenta el tamaño de las barras recibidas
+    contar("bytes_descargados", int(df.memory_usage(index=True).sum()), symbol)
+    contar("filas_descargadas", len(df), symbol)
+    return df
+
+
+def duracion_periodo(period):
+    """'60d', '3mo', '6mo', '1y', '2wk' -> DateOffset equivalente."""
+    m = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not m:
+        raise ValueError(f"Periodo no soportado: {period}")
+    n, unidad = int(m.group(1)), m.group(2)
+    return {
+        "d": pd.DateOffset(days=n),
+        "wk": pd.DateOffset(weeks=n),
+        "mo": pd.DateOffset(months=n),
+        "y": pd.DateOffset(years=n),
+    }[unidad]
+
+
+# ================= PROVEEDORES =================
+class ProveedorYahoo:
+    """Proveedor por defecto: Yahoo Finance con el reloj del sistema."""
+
+    def descargar(self, symbol, interval, period=None, start=None):
+        return descargar_yahoo(symbol, interval, period=period, start=start)
+
+    def ahora(self):
+        return pd.Timestamp.now(tz="UTC")
+
+
+def _nombre_fichero(symbol, interval):
+    return re.sub(r"[^\w.=^-]", "_", f"{symbol}_{interval}")
+
+
+def guardar_grabacion(df, directorio, symbol, interval):
+    """Graba barras OHLCV en `directorio` como CSV para reproducirlas después."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, _nombre_fichero(symbol, interval) + ".csv")
+    df[list(COLUMNAS)].to_csv(ruta)
+    return ruta
+
+
+class ProveedorReplay:
+    """
+    Reproduce barras grabadas (CSV o Parquet) con un reloj simulado.
+
+    `descargar` solo devuelve las barras ya completas en el instante del reloj,
+    con el mismo recorte por `period`/`start` que Yahoo. El reloj avanza a
+    mano (`avanzar`, `fijar`) o, con `velocidad`, a ese múltiplo del tiempo
+    real desde `inicio`.
+    """
+
+    def __init__(self, series, inicio=None, velocidad=None):
+        self.series = {clave: _normalizar(df).sort_index() for clave, df in series.items()}
+        if inicio is None:
+            inicio = min(df.index[0] for df in self.series.values())
+        self._reloj = _a_utc(pd.Timestamp(inicio))
+        self.velocidad = velocidad
+        self._t0 = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_directorio(cls, directorio, **kwargs):
+        """Carga `{symbol}_{interval}.csv|.parquet` de un directorio de grabaciones."""
+        series = {}
+        for nombre in sorted(os.listdir(directorio)):
+            base, ext = os.path.splitext(nombre)
+            ruta = os.path.join(directorio, nombre)
+            if ext == ".csv":
+                df = pd.read_csv(ruta, index_col=0)
+                df.index = pd.to_datetime(df.index, utc=True)
+            elif ext == ".parquet":
+                df = pd.read_parquet(ruta)
+            else:
+                continue
+            symbol, _, interval = base.rpartition("_")
+            series[(symbol, interval)] = df
+        if not series:
+            raise FileNotFoundError(f"Sin grabaciones en {directorio}")
+        return cls(series, **kwargs)
+
+    def ahora(self):
+        with self._lock:
+            if self.velocidad:
+                return self._reloj + pd.Timedelta(seconds=(time.monotonic() - self._t0) * self.velocidad)
+            return self._reloj
+
+    def fijar(self, instante):
+        with self._lock:
+            self._reloj = _a_utc(pd.Timestamp(instante))
+            self._t0 = time.monotonic()
+
+    def avanzar(self, delta):
+        self.fijar(self.ahora() + pd.Timedelta(delta))
+
+    def descargar(self, symbol, interval, period=None, start=None):
+        df = self.series.get((symbol, interval))
+        if df is None:
+            raise KeyError(f"Sin grabación para {symbol} {interval}")
+        ahora = self.ahora()
+        # Solo barras completas: la que empieza en t termina en t + intervalo
+        fin = df.index.searchsorted(_alinear(ahora - pd.Timedelta(_DURACION_INTERVALO.get(interval, interval)), df.index),
+                                    side="right")
+        inicio = 0
+        if start is not None:
+            inicio = df.index.searchsorted(_alinear(start, df.index))
+        elif period is not None:
+            inicio = df.index.searchsorted(_alinear(ahora - duracion_periodo(period), df.index))
+        return df.iloc[inicio:fin]
+
+
+_DURACION_INTERVALO = {"1h": "1h", "1d": "1D", "1wk": "7D"}
+
+
+def _a_utc(ts):
+    return ts.tz_localize("UTC") if ts.tz is None else ts.tz_convert("UTC")
+
+
+def _alinear(ts, indice):
+    """Timestamp comparable con `indice` (los timestamps sin zona se toman como UTC)."""
+    ts = _a_utc(pd.Timestamp(ts))
+    return ts.tz_localize(None) if indice.tz is None else ts.tz_convert(indice.tz)
+
+
+_PROVEEDOR = None
+
+
+def obtener_proveedor():
+    global _PROVEEDOR
+    with _LOCK_GLOBAL:
+        if _PROVEEDOR is None:
+            _PROVEEDOR = ProveedorYahoo()
+    return _PROVEEDOR
+
+
+def fijar_proveedor(proveedor):
+    """Sustituye la fuente de datos de todo el proceso (p. ej. por un `ProveedorReplay`)."""
+    global _PROVEEDOR
+    with _LOCK_GLOBAL:
+        _PROVEEDOR = proveedor
+
+
+# ================= ALMACÉN LOCAL =================
+class AlmacenBarras:
+    """
+    Barras OHLCV en disco, una carpeta por (símbolo, intervalo).
+
+    Cada columna es un .npy (el índice en nanosegundos int64) que se lee con
+    memory-map. Las escrituras crean ficheros de una generación nueva y luego
+    sustituyen `meta.json` de forma atómica, así que un lector (otra sesión u
+    otro proceso) nunca ve una mezcla de generaciones.
+    """
+
+    def __init__(self, directorio=DIR_BARRAS):
+        self.directorio = directorio
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _carpeta(self, symbol, interval):
+        nombre = re.sub(r"[^\w.=^-]", "_", f"{symbol}_{interval}")
+        return os.path.join(self.directorio, nombre)
+
+    def lock(self, symbol, interval):
+        with self._lock:
+            return self._locks.setdefault((symbol, interval), threading.Lock())
+
+    def _meta(self, carpeta):
+        try:
+            with open(os.path.join(carpeta, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def leer(self, symbol, interval):
+        """Devuelve (DataFrame, meta) o (None, None) si no hay nada guardado."""
+        carpeta = self._carpeta(symbol, interval)
+        meta = self._meta(carpeta)
+        if meta is None:
+            return None, None
+        prefijo = meta["prefijo"]
+        try:
+            ns = np.load(os.path.join(carpeta, f"{prefijo}.index.npy"), mmap_mode="r")
+            datos = {c: np.load(os.path.join(carpeta, f"{prefijo}.{c}.npy"), mmap_mode="r")
+                     for c in COLUMNAS}
+        except OSError:
+            return None, None
+        indice = pd.DatetimeIndex(np.asarray(ns, dtype="datetime64[ns]"))
+        if meta.get("tz"):
+            indice = indice.tz_localize("UTC").tz_convert(meta["tz"])
+        return pd.DataFrame(datos, index=indice), meta
+
+    def guardar(self, symbol, interval, df, cubierto_desde=None):
+        carpeta = self._carpeta(symbol, interval)
+        os.makedirs(carpeta, exist_ok=True)
+        anterior = self._meta(carpeta)
+        gen = anterior["generacion"] + 1 if anterior else 0
+        # El pid evita que dos procesos (dashboard y daemon) escriban los mismos ficheros
+        prefijo = f"{gen}-{os.getpid()}"
+
+        indice = df.index
+        tz = str(indice.tz) if indice.tz is not None else None
+        if tz:
+            indice = indice.tz_convert("UTC").tz_localize(None)
+        np.save(os.path.join(carpeta, f"{prefijo}.index.npy"), indice.as_unit("ns").asi8)
+        for c in COLUMNAS:
+            np.save(os.path.join(carpeta, f"{prefijo}.{c}.npy"), df[c].to_numpy(dtype=np.float64))
+
+        meta = {"generacion": gen, "prefijo": prefijo, "tz": tz, "filas": len(df), "cubierto_desde": cubierto_desde}
+        tmp = os.path.join(carpeta, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(carpeta, "meta.json"))
+
+        # Limpiar generaciones anteriores (en Windows pueden seguir abiertas por mmap). Solo las de antes de
+        # la anterior: la anterior puede estar leyéndola quien cargó meta.json justo antes de sustituirlo, y
+        # las de esta generación o posteriores pueden ser de otro proceso y estar en el meta.json actual
+        for nombre in os.listdir(carpeta):
+            try:
+                generacion = int(nombre.split("-", 1)[0])
+            except ValueError:
+                continue
+            if nombre.endswith(".npy") and generacion < gen - 1:
+                try:
+                    os.remove(os.path.join(carpeta, nombre))
+                except OSError:
+                    pass
+        return meta
+
+
+def fusionar(viejo, nuevo):
+    """Une barras guardadas y descargadas; las nuevas sustituyen a las solapadas."""
+    if viejo is None or viejo.empty:
+        return nuevo.sort_index()
+    if nuevo.empty:
+        return viejo
+    if viejo.index.tz is not None and nuevo.index.tz is not None:
+        nuevo = nuevo.tz_convert(viejo.index.tz)
+    df = pd.concat([viejo, nuevo[list(COLUMNAS)]])
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+_ALMACEN = None
+
+
+def obtener_almacen():
+    global _ALMACEN
+    with _LOCK_GLOBAL:
+        if _ALMACEN is None:
+            _ALMACEN = AlmacenBarras()
+    return _ALMACEN
+
+
+def obtener_barras(symbol, interval, period, almacen=None, descargar=None):
+    """
+    Barras de los últimos `period` para (symbol, interval) a partir del almacén.
+
+    Solo se descargan las barras desde la última guardada (que se vuelve a pedir
+    porque puede estar en formación). Si lo guardado no cubre el periodo pedido
+    se descarga el periodo completo. Sin conexión se sirve lo que haya en disco.
+    """
+    almacen = almacen or obtener_almacen()
+    proveedor = obtener_proveedor()
+    descargar = descargar or proveedor.descargar
+    with medir("carga", symbol), almacen.lock(symbol, interval):
+        guardado, meta = almacen.leer(symbol, interval)
+        try:
+            inicio_pedido = proveedor.ahora().tz_localize(None) - duracion_periodo(period)
+            cubierto = meta.get("cubierto_desde") if meta else None
+            if guardado is None or guardado.empty or cubierto is None or pd.Timestamp(cubierto) > inicio_pedido:
+                nuevo = _normalizar(descargar(symbol, interval, period=period))
+                if not nuevo.empty:
+                    cubierto = inicio_pedido.isoformat()
+            else:
+                nuevo = _normalizar(descargar(symbol, interval, start=guardado.index[-1]))
+            df = fusionar(guardado, nuevo)
+            if not df.empty and (guardado is None or not df.equals(guardado)
+                                 or cubierto != meta.get("cubierto_desde")):
+                almacen.guardar(symbol, interval, df, cubierto_desde=cubierto)
+        except Exception:
+            if guardado is None:
+                raise
+            df = guardado
+
+    if df.empty:
+        return df
+    return df[df.index >= df.index[-1] - duracion_periodo(period)]
+
+
+# ================= CACHÉ COMPARTIDA =================
+def recordar(memo, clave, valor, maximo):
+    """Inserta en un OrderedDict usado como LRU y expulsa lo más antiguo."""
+    memo[clave] = valor
+    memo.move_to_end(clave)
+    while len(memo) > maximo:
+        memo.popitem(last=False)
+
+
+class CacheMercado:
+    """
+    Caché en memoria del proceso, compartida por todas las sesiones.
+
+    Cada entrada caduca a los `ttl` segundos y, si se supera `max_bytes`, se
+    expulsan las menos usadas. Si varias sesiones piden a la vez una clave que
+    no está, solo una ejecuta la carga y el resto espera su resultado
+    (single-flight). Los DataFrames se sirven como copia superficial: no se
+    copian los datos y, con copy-on-write, quien la modifique no altera la
+    entrada compartida.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES_CACHE, nombre="cache"):
+        self.max_bytes = max_bytes
+        self.nombre = nombre  # Prefijo de los contadores de métricas
+        self._entradas = OrderedDict()  # clave -> (valor, caduca, bytes)
+        self._en_curso = {}  # clave -> Future
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "esperas": 0}
+
+    @staticmethod
+    def _tamaño(valor):
+        if isinstance(valor, pd.DataFrame):
+            return int(valor.memory_usage(index=True).sum())
+        if isinstance(valor, (str, bytes)):
+            return len(valor)
+        return 0
+
+    @staticmethod
+    def _servir(valor):
+        return valor.copy(deep=False) if isinstance(valor, pd.DataFrame) else valor
+
+    def obtener(self, clave, cargar, ttl):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[1] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                tipo = "aciertos"
+            else:
+                futuro = self._en_curso.get(clave)
+                propio = futuro is None
+                if propio:
+                    futuro = self._en_curso[clave] = Future()
+                tipo = "fallos" if propio else "esperas"
+            self.estadisticas[tipo] += 1
+        contar(f"{self.nombre}_{tipo}", symbol=clave[0] if isinstance(clave, tuple) else clave)
+        if tipo == "aciertos":
+            return self._servir(entrada[0])
+
+        if not propio:
+            return self._servir(futuro.result())
+
+        try:
+            valor = cargar()
+        except BaseException as e:
+            with self._lock:
+                del self._en_curso[clave]
+            futuro.set_exception(e)
+            raise
+        with self._lock:
+            del self._en_curso[clave]
+            self._guardar(clave, valor, ttl)
+        futuro.set_result(valor)
+        return self._servir(valor)
+
+    def _guardar(self, clave, valor, ttl):
+        anterior = self._entradas.pop(clave, None)
+        if anterior is not None:
+            self._bytes -= anterior[2]
+        tamaño = self._tamaño(valor)
+        self._entradas[clave] = (valor, time.monotonic() + ttl, tamaño)
+        self._bytes += tamaño
+        while self._bytes > self.max_bytes and len(self._entradas) > 1:
+            _, (_, _, liberado) = self._entradas.popitem(last=False)
+            self._bytes -= liberado
+
+    def invalidar(self, clave=None):
+        with self._lock:
+            if clave is None:
+                self._entradas.clear()
+                self._bytes = 0
+            elif clave in self._entradas:
+                self._bytes -= self._entradas.pop(clave)[2]
+
+
+_CACHE = None
+
+
+def obtener_cache():
+    global _CACHE
+    with _LOCK_GLOBAL:
+        if _CACHE is None:
+            _CACHE = CacheMercado()
+    return _CACHE
+
+
+def obtener_barras_compartidas(symbol, interval, period):
+    """`obtener_barras` a través de la caché del proceso (una descarga por TTL para todas las sesiones)."""
+    return obtener_cache().obtener((symbol, interval, period),
+                                   lambda: obtener_barras(symbol, interval, period),
+                                   TTL_CACHE.get(interval, 60))
+
+
+# ================= DESCARGA CONCURRENTE =================
+def cargar_en_paralelo(peticiones, cargar=obtener_barras, max_concurrencia=8, timeout=30):
+    """
+    Ejecuta `cargar(*args)` para cada petición {clave: args} en un pool de hilos.
+
+    Como mucho `max_concurrencia` peticiones a la vez, y cada una dispone de
+    `timeout` segundos desde que empieza. Devuelve (resultados, errores): los
+    fallos o timeouts de una petición no afectan al resto. Los hilos que se
+    quedan colgados no bloquean la respuesta.
+    """
+    resultados, errores = {}, {}
+    if not peticiones:
+        return resultados, errores
+
+    hilos = min(max_concurrencia, len(peticiones))
+    inicios = {}
+
+    def tarea(clave, args):
+        inicios[clave] = time.monotonic()
+        return cargar(*args)
+
+    pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="descarga")
+    # Cada tarea con una copia del contexto: las métricas llegan a la ejecución que las pidió
+    futuros = {pool.submit(contextvars.copy_context().run, tarea, clave, args): clave
+               for clave, args in peticiones.items()}
+    pendientes = set(futuros)
+    # Tope global por si todos los hilos quedan colgados y hay peticiones en cola
+    limite_total = time.monotonic() + timeout * -(-len(peticiones) // hilos)
+    try:
+        while pendientes:
+            ahora = time.monotonic()
+            limites = [inicios[futuros[f]] + timeout for f in pendientes if futuros[f] in inicios]
+            espera = max(0.0, min(limites + [limite_total]) - ahora)
+            hechos, pendientes = wait(pendientes, timeout=espera, return_when=FIRST_COMPLETED)
+            for f in hechos:
+                clave = futuros[f]
+                try:
+                    resultados[clave] = f.result()
+                except Exception as e:
+                    errores[clave] = e
+
+            ahora = time.monotonic()
+            for f in list(pendientes):
+                clave = futuros[f]
+                if ahora >= limite_total or (clave in inicios and ahora - inicios[clave] >= timeout):
+                    errores[clave] = TimeoutError(f"{clave}: sin respuesta en {timeout}s")
+                    pendientes.discard(f)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return resultados, errores
@@ -0,0 +1,219 @@
+"""
+Diario persistente de cruces, cambios de señal y alertas enviadas (SQLite).
+
+Cada evento se anota una sola vez: la clave (símbolo, tipo, parámetros,
+barra, valor) es única, así que un reinicio, otra sesión del dashboard o el
+daemon no duplican cruces ni alertas. La tabla está ordenada por esa clave
+(sin rowid), así que los eventos de un símbolo en un intervalo de tiempo se
+leen seguidos, sin recorrer las barras.
+
+    diario = obtener_diario()
+    nuevos = diario.sincronizar_cruces("GC=F", cerradas, clave_params(5, 15, 9), origen="daemon")
+    if diario.registrar("GC=F", "alerta", barra, "alza", params):
+        ...  # primera vez: enviar
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from temporalidades import TZ_SESION
+
+# ================= CONFIG =================
+RUTA_DIARIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "diario.sqlite")
+TIPOS = ("cruce", "señal", "alerta")
+# Parámetros de los que depende la señal, en el orden de su clave
+PARAMS_SEÑAL = ("ema_fast", "ema_slow", "lrs_period", "adr_period", "min_ema_dist", "min_ema_slope", "max_adr_use")
+_LOCK_GLOBAL = threading.Lock()
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    symbol TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    params TEXT NOT NULL,
+    instante INTEGER NOT NULL,
+    valor TEXT NOT NULL,
+    precio REAL,
+    ema_rapida REAL,
+    ema_lenta REAL,
+    lrs REAL,
+    origen TEXT,
+    registrado REAL NOT NULL,
+    PRIMARY KEY (symbol, tipo, params, instante, valor)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS progreso (
+    symbol TEXT NOT NULL,
+    params TEXT NOT NULL,
+    origen TEXT NOT NULL,
+    instante INTEGER NOT NULL,
+    PRIMARY KEY (symbol, params, origen)
+);
+"""
+_COLUMNAS = ("symbol", "tipo", "params", "instante", "valor", "precio", "ema_rapida", "ema_lenta", "lrs",
+             "origen", "registrado")
+
+
+def clave_params(*valores):
+    """Parámetros de los que depende un evento, como texto ('5/15/9')."""
+    return "/".join(str(v) for v in valores)
+
+
+def _ns(instante):
+    return pd.Timestamp(instante).as_unit("ns").value
+
+
+def _float(valor):
+    return None if valor is None or np.isnan(valor) else float(valor)
+
+
+class Diario:
+    """
+    Eventos en una base SQLite (modo WAL: el daemon escribe mientras el
+    dashboard lee). `instante` es el inicio de la barra en ns UTC. Una
+    conexión por proceso, compartida por los hilos con un lock.
+    """
+
+    def __init__(self, ruta=RUTA_DIARIO):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(ruta, timeout=30, isolation_level=None, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.executescript(_ESQUEMA)
+
+    def registrar(self, symbol, tipo, instante, valor, params="", precio=None, ema_rapida=None, ema_lenta=None,
+                  lrs=None, origen=None):
+        """Anota un evento. Devuelve False si ya estaba anotado."""
+        with self._lock:
+            return self._insertar(symbol, tipo, instante, valor, params, precio, ema_rapida, ema_lenta, lrs, origen)
+
+    def _insertar(self, symbol, tipo, instante, valor, params, precio=None, ema_rapida=None, ema_lenta=None,
+                  lrs=None, origen=None):
+        # Con self._lock tomado
+        cur = self._con.execute(
+            "INSERT OR IGNORE INTO eventos (symbol, tipo, params, instante, valor, precio, ema_rapida, ema_lenta,"
+            " lrs, origen, registrado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (symbol, tipo, params, _ns(instante), valor, _float(precio), _float(ema_rapida), _float(ema_lenta),
+             _float(lrs), origen, time.time()))
+        return cur.rowcount == 1
+
+    def registrar_senal(self, symbol, instante, señal, params="", precio=None, origen=None):
+        """
+        Anota la señal solo si cambia respecto a la última anotada. Devuelve si
+        la ha anotado. La comprobación y la inserción van en una transacción
+        BEGIN IMMEDIATE: otra sesión o el daemon no pueden anotar el mismo
+        cambio entre las dos.
+        """
+        with self._lock:
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                fila = self._con.execute(
+                    "SELECT valor FROM eventos WHERE symbol = ? AND tipo = 'señal' AND params = ?"
+                    " ORDER BY instante DESC, registrado DESC LIMIT 1", (symbol, params)).fetchone()
+                anotada = (fila is None or fila[0] != señal) and self._insertar(
+                    symbol, "señal", instante, señal, params, precio=precio, origen=origen)
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+            self._con.execute("COMMIT")
+            return anotada
+
+    def sincronizar_cruces(self, symbol, cerradas, params, origen):
+        """
+        Anota los cruces de EMA5 sobre EMA15 de las barras `cerradas` que
+        `origen` aún no había revisado, y devuelve los nuevos (lista de dicts,
+        del más antiguo al más reciente). La primera vez anota todo el
+        histórico y no devuelve nada: no son cruces nuevos.
+        """
+        if len(cerradas) < 2:
+            return []
+        tiempos = cerradas.index.as_unit("ns").asi8
+        with self._lock:
+            fila = self._con.execute("SELECT instante FROM progreso WHERE symbol = ? AND params = ? AND origen = ?",
+                                     (symbol, params, origen)).fetchone()
+        desde = 1 if fila is None else max(int(np.searchsorted(tiempos, fila[0], side="right")), 1)
+        if desde >= len(tiempos):
+            return []
+        # La barra anterior a la primera nueva hace falta para la diferencia
+        parte = cerradas.iloc[desde - 1:]
+        diff = (parte["EMA5"] - parte["EMA15"]).to_numpy()
+        alza = (diff[:-1] <= 0) & (diff[1:] > 0)
+        baja = (diff[:-1] >= 0) & (diff[1:] < 0)
+        idx = np.flatnonzero(alza | baja) + 1
+        ahora = time.time()
+        filas = [(symbol, "cruce", params, int(tiempos[desde - 1 + i]), "alza" if diff[i] > 0 else "baja",
+                  _float(parte["Close"].iat[i]), _float(parte["EMA5"].iat[i]), _float(parte["EMA15"].iat[i]),
+                  _float(parte["LRS"].iat[i]) if "LRS" in parte.columns else None, origen, ahora) for i in idx]
+        with self._lock:
+            self._con.execute("BEGIN")
+            try:
+                # Puede que otro origen ya los haya anotado: para este siguen siendo nuevos
+                self._con.executemany(
+                    "INSERT OR IGNORE INTO eventos (symbol, tipo, params, instante, valor, precio, ema_rapida,"
+                    " ema_lenta, lrs, origen, registrado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", filas)
+                self._con.execute("INSERT OR REPLACE INTO progreso (symbol, params, origen, instante) VALUES (?, ?, ?, ?)",
+                                  (symbol, params, origen, int(tiempos[-1])))
+                self._con.execute("COMMIT")
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+        if fila is None:
+            return []
+        return [dict(zip(_COLUMNAS, f), barra=pd.Timestamp(f[3], unit="ns", tz="UTC")) for f in filas]
+
+    def eventos(self, symbol, tipo=None, params=None, desde=None, hasta=None, limite=None):
+        """Eventos de un símbolo por orden de barra, como DataFrame indexado por la barra (hora de la sesión)."""
+        sql, args = "SELECT * FROM eventos WHERE symbol = ?", [symbol]
+        for columna, valor in (("tipo", tipo), ("params", params)):
+            if valor is not None:
+                sql += f" AND {columna} = ?"
+                args.append(valor)
+        if desde is not None:
+            sql += " AND instante >= ?"
+            args.append(_ns(desde))
+        if hasta is not None:
+            sql += " AND instante <= ?"
+            args.append(_ns(hasta))
+        sql += " ORDER BY instante DESC" if limite else " ORDER BY instante"
+        if limite:
+            sql += f" LIMIT {int(limite)}"
+        with self._lock:
+            filas = self._con.execute(sql, args).fetchall()
+        df = pd.DataFrame(filas, columns=list(_COLUMNAS))
+        if limite:
+            df = df.iloc[::-1]
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop("instante").to_numpy(dtype=np.int64), unit="ns", utc=True)
+                                    .tz_convert(TZ_SESION), name="barra")
+        return df
+
+    def ultimo(self, symbol, tipo, params=None):
+        """El evento de la barra más reciente de un tipo (el último anotado si hay varios), como dict, o None."""
+        sql, args = "SELECT * FROM eventos WHERE symbol = ? AND tipo = ?", [symbol, tipo]
+        if params is not None:
+            sql += " AND params = ?"
+            args.append(params)
+        with self._lock:
+            fila = self._con.execute(sql + " ORDER BY instante DESC, registrado DESC LIMIT 1", args).fetchone()
+        if fila is None:
+            return None
+        evento = dict(zip(_COLUMNAS, fila))
+        evento["barra"] = pd.Timestamp(evento["instante"], unit="ns", tz="UTC")
+        return evento
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
+
+
+_DIARIO = None
+
+
+def obtener_diario():
+    global _DIARIO
+    with _LOCK_GLOBAL:
+        if _DIARIO is None:
+            _DIARIO = Diario()
+    return _DIARIO
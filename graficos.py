@@ -0,0 +1,264 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datos import CacheMercado
+
+# ================= CONFIG =================
+MAX_VELAS = 600
+MAX_PUNTOS = 1500
+MAX_CRUCES = 100
+MAX_BYTES_FIGURAS = 64 * 1024 * 1024
+# Las claves llevan la versión de los datos: el TTL solo limpia lo que ya no se pide
+TTL_FIGURAS = 3600
+# Ejes de make_subplots(rows=3, shared_xaxes=True, vertical_spacing=0.03, row_heights=[0.6, 0.2, 0.2])
+EJES_MONITOR = dict(
+    xaxis=dict(anchor='y', domain=[0.0, 1.0], matches='x3', showticklabels=False, rangeslider=dict(visible=False)),
+    yaxis=dict(anchor='x', domain=[0.436, 1.0]),
+    xaxis2=dict(anchor='y2', domain=[0.0, 1.0], matches='x3', showticklabels=False),
+    yaxis2=dict(anchor='x2', domain=[0.218, 0.406]),
+    xaxis3=dict(anchor='y3', domain=[0.0, 1.0]),
+    yaxis3=dict(anchor='x3', domain=[0.0, 0.188]),
+)
+
+
+def lttb(x, y, n):
+    """
+    Largest-Triangle-Three-Buckets: índices de `n` puntos que conservan la
+    forma de la serie (x numérico creciente). Siempre incluye el primero y el
+    último.
+    """
+    total = len(y)
+    if n >= total or n < 3:
+        return np.arange(total)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bordes = np.linspace(1, total - 1, n - 1).astype(np.int64)
+    indices = np.empty(n, dtype=np.int64)
+    indices[0], indices[-1] = 0, total - 1
+    a = 0
+    for i in range(n - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        sig_fin = bordes[i + 2] if i + 2 < n - 1 else total
+        # Vértice C: media del siguiente bucket
+        cx, cy = x[bordes[i + 1]:sig_fin].mean(), y[bordes[i + 1]:sig_fin].mean()
+        areas = np.abs((x[a] - cx) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (cy - y[a]))
+        a = ini + int(np.nanargmax(areas)) if not np.isnan(areas).all() else ini
+        indices[i + 1] = a
+    return indices
+
+
+def agrupar_velas(df, max_velas):
+    """Une velas consecutivas en como mucho `max_velas` (O primera, H máx, L mín, C última, V suma)."""
+    n = len(df)
+    if n <= max_velas:
+        return df
+    grupo = np.arange(n) * max_velas // n
+    inicios = np.flatnonzero(np.r_[True, grupo[1:] != grupo[:-1]])
+    return pd.DataFrame({
+        "Open": df["Open"].to_numpy()[inicios],
+        "High": np.maximum.reduceat(df["High"].to_numpy(), inicios),
+        "Low": np.minimum.reduceat(df["Low"].to_numpy(), inicios),
+        "Close": df["Close"].to_numpy()[np.r_[inicios[1:] - 1, n - 1]],
+        "Volume": np.add.reduceat(df["Volume"].to_numpy(), inicios),
+    }, index=df.index[inicios])
+
+
+def cruces_emas(df):
+    """Máscaras (alcistas, bajistas) de los cruces de EMA5 sobre EMA15."""
+    diff = (df["EMA5"] - df["EMA15"]).to_numpy()
+    prev = np.r_[np.nan, diff[:-1]]
+    return (prev <= 0) & (diff > 0), (prev >= 0) & (diff < 0)
+
+
+def _fechas(indice):
+    """Fechas como texto ISO en hora local (la que dibuja plotly.js), sin objetos Timestamp que copiar."""
+    indice = pd.DatetimeIndex(indice)
+    if indice.tz is not None:
+        indice = indice.tz_localize(None)
+    return np.datetime_as_string(indice.to_numpy(), unit="s")
+
+
+def _serie(df, columna, ligero, max_puntos):
+    """(x, y) de una línea, reducida con LTTB en modo ligero."""
+    y = df[columna].to_numpy(dtype=np.float64)
+    if ligero and len(y) > max_puntos:
+        validos = np.flatnonzero(~np.isnan(y))
+        sel = validos[lttb(df.index[validos].asi8, y[validos], max_puntos)]
+        return _fechas(df.index[sel]), y[sel]
+    return _fechas(df.index), y
+
+
+def _lineas_verticales(fechas, y0, y1):
+    """Todas las líneas verticales en una sola traza, separadas por None."""
+    x = np.empty(len(fechas) * 3, dtype=object)
+    x[0::3], x[1::3], x[2::3] = fechas, fechas, None
+    y = np.tile(np.array([y0, y1, None], dtype=object), len(fechas))
+    return x, y
+
+
+def _marcas_cruces(df, cruces):
+    """{'alza'|'baja': DataFrame (precio, ema_lenta, lrs) por barra}, del diario o de las máscaras de `df`."""
+    if cruces is not None:
+        return {tipo: cruces[cruces["valor"] == tipo] for tipo in ("alza", "baja")}
+    lrs = df['LRS'].to_numpy() if 'LRS' in df.columns else np.zeros(len(df))
+    return {tipo: pd.DataFrame({"precio": df['Close'].to_numpy()[m], "ema_lenta": df['EMA15'].to_numpy()[m],
+                                "lrs": lrs[m]}, index=df.index[m])
+            for tipo, m in zip(("alza", "baja"), cruces_emas(df))}
+
+
+def figura_monitor(df, ema_fast, ema_slow, lrs_period, ligero=True,
+                   max_velas=MAX_VELAS, max_puntos=MAX_PUNTOS, max_cruces=MAX_CRUCES, cruces=None):
+    """
+    Figura de precio + volumen + LRS del monitor.
+
+    En modo ligero las líneas son WebGL y se reducen con LTTB, las velas se
+    agrupan y solo se dibujan los `max_cruces` cruces más recientes, así que
+    el tamaño de la figura no depende de la longitud del histórico. Los
+    cruces se toman de `cruces` (eventos del diario) si se dan.
+
+    Las trazas se montan como dicts con fechas en texto y plotly las valida
+    una sola vez al crear la figura (con make_subplots + add_trace cada
+    traza se validaba y se copiaba Timestamp a Timestamp).
+    """
+    # plotly (~0,15 s de importación) se carga con la primera figura, no al arrancar
+    import plotly.graph_objects as go
+
+    linea = 'scattergl' if ligero else 'scatter'
+    velas = agrupar_velas(df, max_velas) if ligero else df
+    x_velas = _fechas(velas.index)
+
+    trazas = [dict(type='candlestick', x=x_velas, open=velas['Open'].to_numpy(), high=velas['High'].to_numpy(),
+                   low=velas['Low'].to_numpy(), close=velas['Close'].to_numpy(), name='Precio', xaxis='x', yaxis='y')]
+    x, y = _serie(df, 'EMA5', ligero, max_puntos)
+    trazas.append(dict(type=linea, x=x, y=y, mode='lines', name=f'EMA {ema_fast}', line=dict(color='#38ef7d', width=2),
+                       xaxis='x', yaxis='y'))
+    x, y = _serie(df, 'EMA15', ligero, max_puntos)
+    trazas.append(dict(type=linea, x=x, y=y, mode='lines', name=f'EMA {ema_slow}', line=dict(color='#ee0979', width=2),
+                       xaxis='x', yaxis='y'))
+
+    # volumen en Fila 2
+    colores = np.where(velas['Close'].to_numpy() < velas['Open'].to_numpy(), 'red', 'green')
+    trazas.append(dict(type='bar', x=x_velas, y=velas['Volume'].to_numpy(), name='Volumen', marker=dict(color=colores),
+                       opacity=0.5, xaxis='x2', yaxis='y2'))
+
+    # Cruces: marcadores y líneas verticales en una traza por sentido y fila (no una forma por cruce)
+    marcas = _marcas_cruces(df, cruces)
+    alturas = [('x', 'y', float(df['Low'].min()), float(df['High'].max())),
+               ('x2', 'y2', 0.0, float(np.nanmax(velas['Volume'].to_numpy(), initial=0.0)))]
+    if "LRS" in df.columns and df['LRS'].notna().any():
+        alturas.append(('x3', 'y3', float(df['LRS'].min()), float(df['LRS'].max())))
+    for tipo, nombre, color, posicion in (("alza", 'Cruce Alcista (X)', '#00FF00', 'top center'),
+                                          ("baja", 'Cruce Bajista (X)', '#FF0000', 'bottom center')):
+        marca = marcas[tipo].iloc[-max_cruces:] if ligero else marcas[tipo]
+        if marca.empty:
+            continue
+        fechas = _fechas(marca.index)
+        texto = [f"<b>${precio:.2f}</b><br>LRS: {v:.4f}" for precio, v in zip(marca["precio"], marca["lrs"].fillna(0.0))]
+        trazas.append(dict(
+            type=linea,
+            x=fechas,
+            y=marca["ema_lenta"].to_numpy(),
+            mode='markers+text',
+            text=texto,
+            textposition=posicion,
+            textfont=dict(color=color, size=12),
+            name=nombre,
+            legendgroup=nombre,
+            marker=dict(symbol='x', size=15, color=color, line=dict(width=3, color=color)),
+            xaxis='x', yaxis='y'
+        ))
+        for eje_x, eje_y, y0, y1 in alturas:
+            lx, ly = _lineas_verticales(fechas, y0, y1)
+            trazas.append(dict(type=linea, x=lx, y=ly, mode='lines', line=dict(width=1, dash='dash', color=color),
+                               legendgroup=nombre, showlegend=False, hoverinfo='skip', connectgaps=False,
+                               xaxis=eje_x, yaxis=eje_y))
+
+    # LRS en Fila 3, con la línea cero de referencia
+    formas = []
+    if "LRS" in df.columns:
+        x, y = _serie(df, 'LRS', ligero, max_puntos)
+        trazas.append(dict(type=linea, x=x, y=y, mode='lines', name=f'LRS ({lrs_period})', line=dict(color='#00f2fe', width=2),
+                           fill='tozeroy', fillcolor='rgba(0, 242, 254, 0.1)', xaxis='x3', yaxis='y3'))
+        formas.append(dict(type='line', xref='x3 domain', x0=0, x1=1, yref='y3', y0=0, y1=0,
+                           line=dict(dash='dash', color='gray')))
+
+    layout = dict(EJES_MONITOR, template='plotly_dark', height=800, showlegend=True, hovermode='x unified', shapes=formas)
+    return go.Figure(data=trazas, layout=layout, skip_invalid=True)
+
+
+
+# ================= CONTEXTO MACRO =================
+def figura_linea(df, nombre, titulo, color, relleno):
+    """Cierre de una serie macro con área rellena."""
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df.index, y=df["Close"], mode='lines', name=nombre,
+                             line=dict(color=color, width=3), fill='tozeroy', fillcolor=relleno))
+    fig.update_layout(title=titulo, template='plotly_dark', height=350, hovermode='x unified',
+                      xaxis_tickformat='%d %b %y')
+    return fig
+
+
+def figura_correlaciones(correl, ventana, series=(("DXY", "#4facfe"), ("US10Y", "#ee0979"))):
+    """Correlación móvil del oro con cada serie en todas las ventanas (la elegida, más gruesa)."""
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    for w, estilo in zip(correl["ventanas"], ("dot", "solid", "dash")):
+        for nombre, color in series:
+            if nombre in correl["ventanas"][w]["correlacion"]:
+                serie = correl["ventanas"][w]["correlacion"][nombre]
+                fig.add_trace(go.Scatter(x=serie.index, y=serie, mode='lines', name=f"Oro–{nombre} {w}d",
+                                         line=dict(color=color, width=3 if w == ventana else 1, dash=estilo)))
+    fig.add_hline(y=0, line_color="gray", line_dash="dot")
+    fig.update_layout(title="Correlación Móvil", template='plotly_dark', height=350,
+                      hovermode='x unified', yaxis_range=[-1, 1], xaxis_tickformat='%d %b %y')
+    return fig
+
+
+def figura_betas(beta, ventana):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    for nombre in beta.columns:
+        fig.add_trace(go.Scatter(x=beta.index, y=beta[nombre], mode='lines', name=nombre))
+    fig.update_layout(title=f"Beta del Oro ({ventana}d)", template='plotly_dark', height=350,
+                      hovermode='x unified', xaxis_tickformat='%d %b %y')
+    return fig
+
+
+def figura_matriz(matriz, ventana):
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Heatmap(z=matriz.to_numpy(), x=matriz.columns, y=matriz.index, zmin=-1, zmax=1,
+                               colorscale="RdBu", text=matriz.round(2).to_numpy(), texttemplate="%{text}"))
+    fig.update_layout(title=f"Matriz de Correlaciones ({ventana}d)", template='plotly_dark', height=350)
+    return fig
+
+# ================= CACHÉ DE FIGURAS =================
+_CACHE_FIGURAS = None
+_LOCK_GLOBAL = threading.Lock()
+
+
+def obtener_cache_figuras():
+    global _CACHE_FIGURAS
+    with _LOCK_GLOBAL:
+        if _CACHE_FIGURAS is None:
+            _CACHE_FIGURAS = CacheMercado(MAX_BYTES_FIGURAS, nombre="figuras")
+    return _CACHE_FIGURAS
+
+
+def firma(df):
+    """Versión de un DataFrame de barras: cambia con cualquier barra nueva o con la última."""
+    if df is None or df.empty:
+        return None
+    return (len(df), df.index[0], df.index[-1], tuple(df.iloc[-1]))
+
+
+def figura_serializada(clave, construir):
+    """
+    Figura de `construir()` como dict listo para `st.plotly_chart`. Se guarda
+    serializada (JSON) por `clave`, que debe incluir la versión de los datos y
+    los parámetros: con la misma clave no se vuelve a construir.
+    """
+    return json.loads(obtener_cache_figuras().obtener(clave, lambda: construir().to_json(), TTL_FIGURAS))
@@ -0,0 +1,448 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from barras import BarrasCompactas
+from datos import recordar
+
+# ================= CONFIG =================
+# Barras H4 cerradas que se guardan por símbolo (unos 2,5 años de sesiones)
+MAX_BARRAS_H4 = 4096
+INDICADORES = ("EMA5", "EMA15", "LRS")
+# Periodos del ADR que se calculan a la vez (los del slider)
+PERIODOS_ADR = tuple(range(5, 31))
+
+
+# ================= LINEAR REGRESSION SLOPE =================
+def calcular_lrs(valores, periodos, bloque=256):
+    """
+    Pendiente de regresión lineal (LRS) móvil sin llamadas Python por barra.
+
+    Usa sumas acumuladas de y y de j*y, de modo que cada ventana se resuelve
+    con dos restas. Para que el error de redondeo no crezca con el historial
+    (años de barras), las sumas se reinician cada `bloque` barras: cada bloque
+    lleva delante el contexto de la ventana más larga y se centra restando su
+    media, así los índices y magnitudes acumuladas quedan acotados.
+
+    `periodos` puede ser un entero (devuelve un array) o una lista de
+    periodos (devuelve un dict {periodo: array}); todos se resuelven con las
+    mismas sumas acumuladas. Las ventanas incompletas o con NaN dan NaN,
+    igual que `rolling(window=n).apply(...)`.
+    """
+    unico = np.isscalar(periodos)
+    lista = [int(periodos)] if unico else sorted({int(p) for p in periodos})
+    if not lista or min(lista) < 2:
+        raise ValueError("El periodo del LRS debe ser >= 2")
+
+    y = np.asarray(valores, dtype=np.float64)
+    total = len(y)
+    if total == 0:
+        vacio = np.empty(0)
+        return vacio if unico else {p: vacio.copy() for p in lista}
+
+    n_max = lista[-1]
+    bloque = max(int(bloque), n_max)
+    num_bloques = -(-total // bloque)
+    ancho = n_max + bloque
+
+    # Contexto a la izquierda y relleno a la derecha marcados como NaN
+    y_pad = np.concatenate([
+        np.full(n_max, np.nan),
+        y,
+        np.full(num_bloques * bloque - total, np.nan),
+    ])
+    filas = np.lib.stride_tricks.sliding_window_view(y_pad, ancho)[::bloque]
+
+    invalido = np.isnan(filas)
+    validos = (~invalido).sum(axis=1)
+    limpio = np.where(invalido, 0.0, filas)
+    referencia = limpio.sum(axis=1) / np.maximum(validos, 1)
+    limpio = np.where(invalido, 0.0, limpio - referencia[:, None])
+
+    j = np.arange(ancho, dtype=np.float64)
+    ceros = np.zeros((num_bloques, 1))
+    suma_y = np.concatenate([ceros, np.cumsum(limpio, axis=1)], axis=1)
+    suma_jy = np.concatenate([ceros, np.cumsum(limpio * j, axis=1)], axis=1)
+    suma_nan = np.concatenate(
+        [np.zeros((num_bloques, 1), dtype=np.int64), np.cumsum(invalido, axis=1)], axis=1
+    )
+
+    # Posiciones propias de cada bloque (el resto es contexto)
+    k = np.arange(n_max, ancho)
+    resultados = {}
+    for n in lista:
+        sum_x = n * (n - 1) / 2
+        sum_x2 = (n - 1) * n * (2 * n - 1) / 6
+        divisor = n * sum_x2 - sum_x ** 2
+
+        sy = suma_y[:, k + 1] - suma_y[:, k + 1 - n]
+        sjy = suma_jy[:, k + 1] - suma_jy[:, k + 1 - n]
+        # x = j - inicio de la ventana
+        sxy = sjy - (k - n + 1) * sy
+        pendiente = (n * sxy - sum_x * sy) / divisor
+
+        con_nan = (suma_nan[:, k + 1] - suma_nan[:, k + 1 - n]) > 0
+        pendiente[con_nan] = np.nan
+        resultados[n] = pendiente.reshape(-1)[:total]
+
+    return resultados[lista[0]] if unico else resultados
+
+
+def pendiente_sumas(n, suma_y, suma_jy):
+    """Pendiente de una ventana de n valores a partir de sus sumas (x = 0..n-1)."""
+    sum_x = n * (n - 1) / 2
+    sum_x2 = (n - 1) * n * (2 * n - 1) / 6
+    return (n * suma_jy - sum_x * suma_y) / (n * sum_x2 - sum_x ** 2)
+
+
+# ================= EMA (mismo recurrente que pandas ewm(adjust=True)) =================
+def factor_ema(span):
+    """Factor de decaimiento de `ewm(span)` (1 - alpha); compartido con `streaming.BarraViva`."""
+    com = (span - 1) / 2.0
+    return 1.0 - 1.0 / (1.0 + com)
+
+
+def ema_paso(media, peso, valor, factor):
+    """Un paso del recurrente de `ewm(span).mean()`; devuelve (media, peso)."""
+    peso *= factor
+    if media != valor:
+        media = (peso * media + valor) / (peso + 1.0)
+    return media, peso + 1.0
+
+
+def ema_peso(observaciones, factor):
+    """Peso acumulado tras `observaciones` barras (converge en pocos cientos de pasos)."""
+    peso = 1.0
+    for _ in range(observaciones - 1):
+        siguiente = peso * factor + 1.0
+        if siguiente == peso:
+            break
+        peso = siguiente
+    return peso
+
+
+# ================= MOTOR INCREMENTAL H4 =================
+class _BarrasSimbolo:
+    """Barras H4 de un símbolo: las cerradas (en un buffer de capacidad fija) y la que se está formando."""
+
+    def __init__(self, cerradas, formando, generacion):
+        self.cerradas = cerradas
+        self.formando = formando
+        self.generacion = generacion
+        # Cambia con cualquier barra nueva o actualización de la que se forma
+        self.version = 0
+        self.firma = None
+
+
+class _EstadoIndicadores:
+    """Estado recurrente de EMA rápida/lenta y ventana LRS tras la última barra cerrada."""
+
+    def __init__(self, generacion, ema_fast, ema_slow, lrs_period, capacidad=MAX_BARRAS_H4, dtype=np.float64):
+        self.generacion = generacion
+        self.spans = (ema_fast, ema_slow)
+        self.factores = (factor_ema(ema_fast), factor_ema(ema_slow))
+        self.lrs_period = lrs_period
+        self.procesadas = 0
+        self.emas = None
+        self.ventana = np.empty(0)
+        self.suma_y = 0.0
+        self.suma_jy = 0.0
+        # Alineadas con las barras cerradas del símbolo (misma capacidad)
+        self.columnas = BarrasCompactas(capacidad, INDICADORES, dtype)
+
+    def fijar_ventana(self, cierres):
+        """Guarda los n-1 últimos cierres cerrados y sus sumas para el LRS."""
+        self.ventana = np.asarray(cierres[-(self.lrs_period - 1):], dtype=np.float64)
+        self.suma_y = float(self.ventana.sum())
+        self.suma_jy = float(np.dot(np.arange(len(self.ventana)), self.ventana))
+
+    def lrs_con(self, cierre):
+        """LRS de la ventana cerrada más un cierre nuevo, en O(1)."""
+        n = self.lrs_period
+        if len(self.ventana) < n - 1:
+            return np.nan
+        return pendiente_sumas(n, self.suma_y + cierre, self.suma_jy + (n - 1) * cierre)
+
+    def emas_con(self, cierre):
+        """EMAs tras añadir un cierre, sin modificar el estado."""
+        if self.emas is None:
+            return (cierre, 1.0), (cierre, 1.0)
+        return tuple(ema_paso(media, peso, cierre, factor)
+                     for (media, peso), factor in zip(self.emas, self.factores))
+
+
+class MotorIndicadores:
+    """
+    Indicadores H4 (EMA rápida, EMA lenta y LRS) mantenidos de forma incremental.
+
+    Recibe las barras H4 (la última en formación) de `RemuestreoSesion`. Por
+    símbolo guarda las H4 ya cerradas y, por símbolo y juego de parámetros, el
+    estado recurrente de las EMAs y las sumas de la ventana LRS. En cada
+    llamada solo se pliegan las barras nuevas; la barra en formación se
+    calcula sobre el estado sin modificarlo. El resultado coincide con un
+    recálculo completo sobre las mismas barras (EMAs bit a bit, LRS salvo
+    redondeo). Se reconstruye todo cuando cambian los parámetros o cuando los
+    datos recibidos ya no enlazan con la última barra cerrada (hueco o revisión).
+
+    Barras e indicadores se guardan en `BarrasCompactas` de `capacidad`
+    barras (las más antiguas se expulsan), con `dtype` float64 o float32: la
+    memoria por símbolo y juego de parámetros es fija (`nbytes`). Con float32
+    las EMAs ya no coinciden bit a bit con pandas.
+
+    Los DataFrames resultantes se memorizan por (símbolo, versión de las
+    barras, parámetros): mover un slider a un valor ya visto, o repetir una
+    ejecución sin datos nuevos, no recalcula nada. Estados y resultados se
+    expulsan por LRU (`max_estados`, `max_resultados`).
+    """
+
+    def __init__(self, max_estados=32, max_resultados=64, capacidad=MAX_BARRAS_H4, dtype=np.float64):
+        self.max_estados = max_estados
+        self.max_resultados = max_resultados
+        self.capacidad = capacidad
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._barras = {}
+        self._estados = OrderedDict()
+        self._resultados = OrderedDict()
+
+    def actualizar(self, symbol, df_h4, ema_fast, ema_slow, lrs_period):
+        with self._lock:
+            barras = self._actualizar_barras(symbol, df_h4)
+            if barras is None:
+                return None
+            clave = (symbol, ema_fast, ema_slow, lrs_period)
+            clave_resultado = (barras.version,) + clave
+            df_h4 = self._resultados.get(clave_resultado)
+            if df_h4 is None:
+                estado = self._estados.get(clave)
+                pendientes = barras.cerradas.total - estado.procesadas if estado is not None else None
+                if estado is None or estado.generacion != barras.generacion or pendientes > len(barras.cerradas):
+                    estado = _EstadoIndicadores(barras.generacion, ema_fast, ema_slow, lrs_period,
+                                                self.capacidad, self.dtype)
+                    self._recalcular(estado, barras.cerradas)
+                elif pendientes:
+                    self._plegar(estado, barras.cerradas.columna("Close")[-pendientes:],
+                                 barras.cerradas.tiempos()[-pendientes:])
+                recordar(self._estados, clave, estado, self.max_estados)
+                df_h4 = self._componer(estado, barras)
+                recordar(self._resultados, clave_resultado, df_h4, self.max_resultados)
+            else:
+                self._resultados.move_to_end(clave_resultado)
+            # Copia superficial: sin copiar datos y sin exponer el DataFrame memorizado
+            return df_h4.copy(deep=False)
+
+    def _actualizar_barras(self, symbol, df_h4):
+        if df_h4 is None or df_h4.empty:
+            return None
+        barras = self._barras.get(symbol)
+        # Mismos datos que en la llamada anterior (p. ej. solo se ha movido un slider)
+        firma = (len(df_h4), df_h4.index[0], df_h4.index[-1], tuple(df_h4.iloc[-1]))
+        if barras is not None and barras.firma == firma:
+            return barras
+
+        if barras is not None and len(barras.cerradas) and barras.cerradas.columnas == tuple(df_h4.columns):
+            ultima = barras.cerradas.ultimo_instante()
+            pos = df_h4.index.searchsorted(ultima)
+            # Enlace: los datos deben contener la última barra cerrada sin cambios
+            if pos < len(df_h4) - 1 and df_h4.index[pos] == ultima and np.array_equal(
+                    df_h4.iloc[pos].to_numpy(dtype=self.dtype), barras.cerradas.ultima_fila(), equal_nan=True):
+                nuevas = df_h4.iloc[pos + 1:]
+                if len(nuevas) > 1 or not nuevas.equals(barras.formando):
+                    barras.cerradas.añadir_df(nuevas.iloc[:-1])
+                    barras.formando = nuevas.iloc[-1:]
+                    barras.version += 1
+                barras.firma = firma
+                return barras
+
+        # Reconstrucción completa
+        generacion = barras.generacion + 1 if barras is not None else 0
+        version = barras.version + 1 if barras is not None else 0
+        cerradas = BarrasCompactas.desde_dataframe(df_h4.iloc[:-1], self.capacidad, self.dtype)
+        barras = _BarrasSimbolo(cerradas, df_h4.iloc[-1:], generacion)
+        barras.version = version
+        barras.firma = firma
+        self._barras[symbol] = barras
+        return barras
+
+    def _recalcular(self, estado, cerradas):
+        m = len(cerradas)
+        if m == 0:
+            return
+        valores = cerradas.columna("Close")
+        cierres = pd.Series(valores)
+        ema_r = cierres.ewm(span=estado.spans[0]).mean().to_numpy()
+        ema_l = cierres.ewm(span=estado.spans[1]).mean().to_numpy()
+        estado.columnas.añadir(cerradas.tiempos(), np.vstack([ema_r, ema_l, calcular_lrs(valores, estado.lrs_period)]))
+        estado.emas = tuple((float(ema[-1]), ema_peso(m, factor))
+                            for ema, factor in zip((ema_r, ema_l), estado.factores))
+        estado.fijar_ventana(valores)
+        estado.procesadas = cerradas.total
+
+    def _plegar(self, estado, cierres, tiempos):
+        nuevos = {"EMA5": [], "EMA15": [], "LRS": []}
+        base = len(estado.ventana)
+        historico = np.concatenate([estado.ventana, cierres])
+        for i, cierre in enumerate(cierres):
+            cierre = float(cierre)
+            nuevos["LRS"].append(estado.lrs_con(cierre))
+            estado.emas = estado.emas_con(cierre)
+            nuevos["EMA5"].append(estado.emas[0][0])
+            nuevos["EMA15"].append(estado.emas[1][0])
+            estado.fijar_ventana(historico[:base + i + 1])
+        estado.columnas.añadir(tiempos, np.array([nuevos[c] for c in INDICADORES]))
+        estado.procesadas += len(cierres)
+
+    def _componer(self, estado, barras):
+        # Una sola copia: las columnas guardadas son vistas de los buffers
+        formando = barras.formando
+        cierre = float(formando["Close"].iloc[-1])
+        (ema_r, _), (ema_l, _) = estado.emas_con(cierre)
+        cerradas = barras.cerradas
+        datos = {c: np.append(cerradas.columna(c), formando[c].to_numpy()) for c in cerradas.columnas}
+        for col, valor in zip(INDICADORES, (ema_r, ema_l, estado.lrs_con(cierre))):
+            datos[col] = np.append(estado.columnas.columna(col), valor)
+        indice = cerradas.indice().append(formando.index.as_unit("ns"))
+        return pd.DataFrame(datos, index=indice)
+
+    def nbytes(self):
+        """Memoria de los buffers de barras e indicadores (sin los resultados memorizados)."""
+        with self._lock:
+            return sum(b.cerradas.nbytes for b in self._barras.values()) + \
+                sum(e.columnas.nbytes for e in self._estados.values())
+
+
+# ================= ADR, CRUCES Y SEÑAL =================
+def true_range(df_d):
+    """True Range diario (NaN el primer día, sin cierre previo)."""
+    high = df_d["High"].to_numpy(dtype=np.float64)
+    low = df_d["Low"].to_numpy(dtype=np.float64)
+    prev_close = np.r_[np.nan, df_d["Close"].to_numpy(dtype=np.float64)[:-1]]
+    # True Range es el máximo de los tres componentes
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def adr_periodos(tr, periodos=PERIODOS_ADR):
+    """
+    EWM del True Range para todos los `periodos` en una pasada por los días:
+    matriz (días × periodos), igual que `ewm(span).mean()` de cada periodo.
+    """
+    factores = np.array([factor_ema(p) for p in periodos])
+    media = np.full(len(periodos), np.nan)
+    peso = np.ones(len(periodos))
+    salida = np.empty((len(tr), len(periodos)))
+    for i, valor in enumerate(tr):
+        if np.isnan(valor):
+            if not np.isnan(media[0]):
+                peso *= factores
+        elif np.isnan(media[0]):
+            media[:] = valor
+        else:
+            # Mismo recurrente que `ema_paso`, con un peso por periodo
+            peso *= factores
+            media = np.where(media != valor, (peso * media + valor) / (peso + 1.0), media)
+            peso += 1.0
+        salida[i] = media
+    return salida
+
+
+def calcular_adr(df_d, adr_period):
+    """ADR como EWM del True Range diario."""
+    return float(pd.Series(true_range(df_d)).ewm(span=adr_period).mean().iloc[-1])
+
+
+class _ADRSimbolo:
+    def __init__(self, firma, adr, rango):
+        self.firma = firma
+        self.adr = adr
+        self.rango = rango
+
+
+class MotorADR:
+    """
+    ADR de todos los periodos de cada símbolo a partir de sus D1 de sesión
+    (las del remuestreo, ya cargadas: sin descargas propias).
+
+    Cuando cambian los datos se calcula el ADR de todos los `periodos` en una
+    pasada; mover el slider del periodo es solo una consulta. También guarda
+    el rango (máximo - mínimo) de la sesión en curso, la última D1, que es el
+    consumo del ADR de hoy.
+    """
+
+    def __init__(self, periodos=PERIODOS_ADR):
+        self.periodos = tuple(periodos)
+        self._posicion = {p: i for i, p in enumerate(self.periodos)}
+        self._lock = threading.Lock()
+        self._simbolos = {}
+
+    def actualizar(self, symbol, df_d):
+        if df_d is None or df_d.empty:
+            return None
+        firma = (len(df_d), df_d.index[0], df_d.index[-1], tuple(df_d.iloc[-1]))
+        with self._lock:
+            estado = self._simbolos.get(symbol)
+            if estado is None or estado.firma != firma:
+                ultimo = df_d.iloc[-1]
+                estado = _ADRSimbolo(firma, adr_periodos(true_range(df_d), self.periodos)[-1],
+                                     float(ultimo["High"] - ultimo["Low"]))
+                self._simbolos[symbol] = estado
+            return estado
+
+    def adr(self, symbol, periodo):
+        if periodo not in self._posicion:
+            raise ValueError(f"Periodo ADR fuera de {self.periodos[0]}-{self.periodos[-1]}: {periodo}")
+        return float(self._simbolos[symbol].adr[self._posicion[periodo]])
+
+    def rango_sesion(self, symbol):
+        return self._simbolos[symbol].rango
+
+
+def detectar_cruce(prev_rapida, prev_lenta, rapida, lenta):
+    """'alza', 'baja' o None comparando las EMAs previas con las actuales."""
+    if prev_rapida <= prev_lenta and rapida > lenta:
+        return "alza"
+    if prev_rapida >= prev_lenta and rapida < lenta:
+        return "baja"
+    return None
+
+
+def estado_adr(consumo_adr):
+    """Etiqueta y clase CSS según el consumo del ADR."""
+    return ("JOVEN", "status-joven") if consumo_adr < 0.30 else \
+           ("OPTIMO", "status-optimo") if consumo_adr < 0.60 else \
+           ("TARDE", "status-tarde") if consumo_adr < 0.80 else \
+           ("AGOTADO", "status-agotado")
+
+
+def evaluar_senal(df, adr_val, min_ema_dist, min_ema_slope, max_adr_use, rango=None):
+    """
+    Regla de entrada sobre la última barra H4: gap entre EMAs, pendiente de la
+    EMA lenta y consumo del ADR (`rango` de la sesión / ADR; sin `rango`, el
+    de todo `df`). Devuelve un dict con las métricas y la señal ('COMPRAR',
+    'VENDER' o 'ESPERAR').
+    """
+    close = float(df["Close"].iloc[-1])
+    if rango is None:
+        rango = float(df["High"].max()) - float(df["Low"].min())
+    ema5 = float(df["EMA5"].iloc[-1])
+    ema15 = float(df["EMA15"].iloc[-1])
+    ema15_prev = float(df["EMA15"].iloc[-2]) if len(df) > 1 else ema15
+    lrs_val = float(df["LRS"].iloc[-1]) if "LRS" in df.columns and not np.isnan(df["LRS"].iloc[-1]) else 0.0
+
+    ema_dist_pct = abs(ema5 - ema15) / close * 100
+    ema_slope_pct = abs(ema15 - ema15_prev) / close * 100
+    consumo_adr = rango / adr_val
+
+    filtros = ema_dist_pct >= min_ema_dist and ema_slope_pct >= min_ema_slope and consumo_adr <= max_adr_use
+    señal = "COMPRAR" if ema5 > ema15 and filtros else "VENDER" if ema5 < ema15 and filtros else "ESPERAR"
+    return {
+        "close": close,
+        "ema5": ema5,
+        "ema15": ema15,
+        "lrs": lrs_val,
+        "ema_dist_pct": ema_dist_pct,
+        "ema_slope_pct": ema_slope_pct,
+        "consumo_adr": consumo_adr,
+        "señal": señal,
+    }
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from datos import recordar
+
+# ================= CONFIG =================
+VENTANAS = (20, 60, 120)  # Días de sesión
+REFERENCIA = "Oro"
+# Series de tipos: se usan cambios en puntos, no rendimientos logarítmicos.
+# El US10Y (^TNX) es el tipo nominal; sirve de aproximación al tipo real.
+NIVELES = ("US10Y",)
+MAX_HISTORIA = 2000
+
+
+def panel_cierres(datos):
+    """Cierres D1 {nombre: df} alineados por fecha de sesión (solo días con todas las series)."""
+    columnas = {nombre: df["Close"] for nombre, df in datos.items() if df is not None and not df.empty}
+    if not columnas:
+        return pd.DataFrame()
+    return pd.concat(columnas, axis=1, join="inner").dropna()
+
+
+def rendimientos(cierres, niveles=NIVELES):
+    """Rendimiento logarítmico diario, o diferencia para las series de `niveles`."""
+    valores = cierres.to_numpy(dtype=np.float64)
+    es_nivel = np.array([c in niveles for c in cierres.columns])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(es_nivel, np.diff(valores, axis=0), np.diff(np.log(valores), axis=0))
+    return pd.DataFrame(r, index=cierres.index[1:], columns=cierres.columns)
+
+
+def cambios_regimen(correlacion):
+    """Fechas en las que la correlación cambia de signo."""
+    signo = np.sign(correlacion.dropna())
+    return signo.index[1:][(signo.to_numpy()[1:] != signo.to_numpy()[:-1]) & (signo.to_numpy()[1:] != 0)]
+
+
+def _acumular(sumas, nuevas):
+    """Añade a las sumas acumuladas las de `nuevas` (mismo orden de suma que un cumsum completo)."""
+    return np.concatenate([sumas[:-1], np.cumsum(np.concatenate([sumas[-1:], nuevas]), axis=0)])
+
+
+class MotorCorrelaciones:
+    """
+    Correlaciones y betas móviles de la referencia (el oro) frente al resto
+    de series macro, y matriz de correlaciones, para varias ventanas.
+
+    Guarda las sumas acumuladas de los rendimientos y de sus productos
+    cruzados; cada ventana se resuelve con restas. Cuando llegan datos nuevos
+    solo se recalculan las filas desde el primer día que cambia (normalmente
+    la sesión en curso). Los datos pueden empezar más tarde que los
+    guardados (el periodo descargado avanza), siempre que enlacen. Los
+    resultados se memorizan por versión de los datos y ventanas.
+    """
+
+    def __init__(self, ventanas=VENTANAS, referencia=REFERENCIA, max_resultados=8):
+        self.ventanas = tuple(ventanas)
+        self.referencia = referencia
+        self.max_resultados = max_resultados
+        self._lock = threading.Lock()
+        self._columnas = None
+        self._fechas = None
+        self._r = None
+        self._suma = None      # (n + 1, k)
+        self._suma_xy = None   # (n + 1, k, k)
+        self._firma = None
+        self.version = 0
+        self._resultados = OrderedDict()
+
+    def actualizar(self, datos):
+        """
+        `datos`: {nombre: D1}. Devuelve {"version", "fechas", "ventanas": {w:
+        {"correlacion", "beta", "matriz"}}} o None si no hay días comunes
+        suficientes. `correlacion` y `beta` tienen una columna por serie.
+        """
+        cierres = panel_cierres(datos)
+        if self.referencia not in cierres.columns or len(cierres) < 3:
+            return None
+        with self._lock:
+            firma = (tuple(cierres.columns), len(cierres), cierres.index[0], cierres.index[-1],
+                     tuple(cierres.iloc[-1]))
+            if firma != self._firma:
+                self._actualizar_sumas(rendimientos(cierres))
+                self._firma = firma
+                self.version += 1
+            clave = (self.version, self.ventanas)
+            resultado = self._resultados.get(clave)
+            if resultado is None:
+                resultado = self._componer()
+                recordar(self._resultados, clave, resultado, self.max_resultados)
+            else:
+                self._resultados.move_to_end(clave)
+            return resultado
+
+    def _actualizar_sumas(self, r):
+        valores = r.to_numpy()
+        desde = self._enlace(r)
+        if desde is None:
+            self._columnas = list(r.columns)
+            self._reiniciar(r.index, valores)
+            return
+        # Se conservan las filas guardadas hasta `desde` y se añaden las nuevas
+        pos = self._fechas.get_loc(r.index[0])
+        nuevas = valores[desde - pos:]
+        self._fechas = self._fechas[:desde].append(r.index[desde - pos:])
+        self._r = np.concatenate([self._r[:desde], nuevas])
+        self._suma = _acumular(self._suma[:desde + 1], nuevas)
+        self._suma_xy = _acumular(self._suma_xy[:desde + 1], nuevas[:, :, None] * nuevas[:, None, :])
+        if len(self._r) > MAX_HISTORIA:
+            self._reiniciar(self._fechas[-MAX_HISTORIA:], self._r[-MAX_HISTORIA:])
+
+    def _reiniciar(self, fechas, valores):
+        k = valores.shape[1]
+        self._fechas = fechas
+        self._r = valores
+        self._suma = _acumular(np.zeros((1, k)), valores)
+        self._suma_xy = _acumular(np.zeros((1, k, k)), valores[:, :, None] * valores[:, None, :])
+
+    def _enlace(self, r):
+        """Primera fila guardada que hay que recalcular, o None si los datos no enlazan."""
+        if self._columnas != list(r.columns) or self._fechas is None or not len(r):
+            return None
+        if r.index[0] not in self._fechas:
+            return None
+        pos = self._fechas.get_loc(r.index[0])
+        comunes = min(len(self._fechas) - pos, len(r))
+        if not self._fechas[pos:pos + comunes].equals(r.index[:comunes]):
+            return None
+        iguales = (self._r[pos:pos + comunes] == r.to_numpy()[:comunes]).all(axis=1)
+        distintas = np.flatnonzero(~iguales)
+        return pos + (distintas[0] if len(distintas) else comunes)
+
+    def _componer(self):
+        n, k = self._r.shape
+        ref = self._columnas.index(self.referencia)
+        otras = [c for c in self._columnas if c != self.referencia]
+        idx_otras = [self._columnas.index(c) for c in otras]
+        resultado = {"version": self.version, "fechas": self._fechas, "ventanas": {}}
+        for w in self.ventanas:
+            if n < w:
+                continue
+            fin = np.arange(w, n + 1)
+            s = self._suma[fin] - self._suma[fin - w]
+            sxy = self._suma_xy[fin] - self._suma_xy[fin - w]
+            cov = (sxy - s[:, :, None] * s[:, None, :] / w) / (w - 1)
+            var = np.diagonal(cov, axis1=1, axis2=2)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                corr = cov[:, ref, idx_otras] / np.sqrt(var[:, ref, None] * var[:, idx_otras])
+                beta = cov[:, ref, idx_otras] / var[:, idx_otras]
+                ultima = cov[-1] / np.sqrt(np.outer(var[-1], var[-1]))
+            fechas = self._fechas[w - 1:]
+            resultado["ventanas"][w] = {
+                "correlacion": pd.DataFrame(corr, index=fechas, columns=otras),
+                "beta": pd.DataFrame(beta, index=fechas, columns=otras),
+                "matriz": pd.DataFrame(ultima, index=self._columnas, columns=self._columnas),
+            }
+        return resultado
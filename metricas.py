@@ -0,0 +1,225 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# ================= CONFIG =================
+DIR_METRICAS = os.path.dirname(os.path.abspath(__file__))
+RUTA_LOG = os.path.join(DIR_METRICAS, "metricas.jsonl")
+RUTA_PROMETHEUS = os.path.join(DIR_METRICAS, "metricas.prom")
+MAX_BYTES_LOG = 5 * 1024 * 1024  # Al pasar de aquí el log rota a metricas.jsonl.1, .2...
+COPIAS_LOG = 3
+CUANTILES = (0.5, 0.9, 0.99)
+
+# Ejecución (rerun) en curso; `cargar_en_paralelo` la propaga a sus hilos
+_EJECUCION = contextvars.ContextVar("ejecucion", default=None)
+
+
+class Ejecucion:
+    """Duraciones por etapa y contadores de una ejecución del script."""
+
+    def __init__(self, origen):
+        self.origen = origen
+        self.inicio = time.time()
+        self.duracion = None
+        self.etapas = []  # (etapa, symbol, segundos)
+        self.contadores = defaultdict(float)  # (nombre, symbol) -> valor
+        self._lock = threading.Lock()
+
+    def como_dict(self):
+        with self._lock:
+            return {
+                "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+                "origen": self.origen,
+                "duracion_ms": round(self.duracion * 1000, 3) if self.duracion is not None else None,
+                "etapas": [{"etapa": e, "symbol": s, "ms": round(t * 1000, 3)} for e, s, t in self.etapas],
+                "contadores": [{"nombre": n, "symbol": s, "valor": v} for (n, s), v in self.contadores.items()],
+            }
+
+
+class Metricas:
+    """
+    Acumulado del proceso: las últimas `ventana` duraciones por etapa (para
+    los percentiles), número y suma de todas, y contadores por símbolo.
+    """
+
+    def __init__(self, ventana=1000):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._recientes = defaultdict(lambda: deque(maxlen=self.ventana))
+        self._totales = defaultdict(lambda: [0, 0.0])
+        self._contadores = defaultdict(float)
+
+    def registrar(self, etapa, segundos):
+        with self._lock:
+            self._recientes[etapa].append(segundos)
+            total = self._totales[etapa]
+            total[0] += 1
+            total[1] += segundos
+
+    def sumar(self, nombre, valor, symbol=None):
+        with self._lock:
+            self._contadores[(nombre, symbol)] += valor
+
+    def resumen(self):
+        """{etapa: {"n", "p50", "p90", "p99"}} en milisegundos sobre la ventana reciente."""
+        with self._lock:
+            recientes = {e: np.array(d) for e, d in self._recientes.items()}
+            totales = {e: tuple(t) for e, t in self._totales.items()}
+        resumen = {}
+        for etapa, valores in sorted(recientes.items()):
+            fila = {"n": totales[etapa][0]}
+            for q in CUANTILES:
+                fila[f"p{int(q * 100)}"] = float(np.quantile(valores, q) * 1000)
+            resumen[etapa] = fila
+        return resumen
+
+    def prometheus(self):
+        """Texto en formato de exposición de Prometheus (summary por etapa y contadores)."""
+        with self._lock:
+            recientes = {e: np.array(d) for e, d in self._recientes.items()}
+            totales = {e: tuple(t) for e, t in self._totales.items()}
+            contadores = dict(self._contadores)
+        lineas = [
+            "# HELP oro_dashboard_etapa_segundos Duración de cada etapa del dashboard.",
+            "# TYPE oro_dashboard_etapa_segundos summary",
+        ]
+        for etapa in sorted(recientes):
+            for q in CUANTILES:
+                lineas.append(f'oro_dashboard_etapa_segundos{{etapa="{etapa}",quantile="{q}"}} '
+                              f'{np.quantile(recientes[etapa], q):.6f}')
+            n, suma = totales[etapa]
+            lineas.append(f'oro_dashboard_etapa_segundos_sum{{etapa="{etapa}"}} {suma:.6f}')
+            lineas.append(f'oro_dashboard_etapa_segundos_count{{etapa="{etapa}"}} {n}')
+        nombres = sorted({n for n, _ in contadores})
+        for nombre in nombres:
+            lineas.append(f"# TYPE oro_dashboard_{nombre}_total counter")
+            for (n, symbol), valor in sorted(contadores.items(), key=lambda x: str(x[0])):
+                if n == nombre:
+                    etiqueta = f'{{symbol="{symbol}"}}' if symbol else ""
+                    lineas.append(f"oro_dashboard_{nombre}_total{etiqueta} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+
+_METRICAS = None
+_LOCK_GLOBAL = threading.Lock()
+
+
+def obtener_metricas():
+    global _METRICAS
+    with _LOCK_GLOBAL:
+        if _METRICAS is None:
+            _METRICAS = Metricas()
+    return _METRICAS
+
+
+_ARRANQUE = {}
+
+
+def marcar_arranque(etapa, segundos):
+    """
+    Anota una duración del arranque del proceso (importaciones, primera
+    pintura...). Solo cuenta la primera vez: devuelve False si ya estaba.
+    """
+    with _LOCK_GLOBAL:
+        if etapa in _ARRANQUE:
+            return False
+        _ARRANQUE[etapa] = segundos
+    obtener_metricas().registrar(etapa, segundos)
+    return True
+
+
+def arranque():
+    """{etapa: ms} de las duraciones del arranque anotadas hasta ahora."""
+    with _LOCK_GLOBAL:
+        return {e: round(s * 1000, 3) for e, s in _ARRANQUE.items()}
+
+
+@contextmanager
+def medir(etapa, symbol=None):
+    """Mide un bloque y lo anota en el proceso y en la ejecución en curso (si la hay)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        obtener_metricas().registrar(etapa, segundos)
+        ejecucion = _EJECUCION.get()
+        if ejecucion is not None:
+            with ejecucion._lock:
+                ejecucion.etapas.append((etapa, symbol, segundos))
+
+
+def contar(nombre, valor=1, symbol=None):
+    obtener_metricas().sumar(nombre, valor, symbol)
+    ejecucion = _EJECUCION.get()
+    if ejecucion is not None:
+        with ejecucion._lock:
+            ejecucion.contadores[(nombre, symbol)] += valor
+
+
+def iniciar_ejecucion(origen="dashboard"):
+    ejecucion = Ejecucion(origen)
+    _EJECUCION.set(ejecucion)
+    return ejecucion
+
+
+_LOCK_LOG = threading.Lock()
+
+
+def _rotar_log(ruta, max_bytes=MAX_BYTES_LOG, copias=COPIAS_LOG):
+    """Si el log supera `max_bytes` lo desplaza a .1 (y .1 a .2...), descartando el más antiguo."""
+    try:
+        if os.path.getsize(ruta) < max_bytes:
+            return
+    except OSError:
+        return
+    for i in range(copias - 1, 0, -1):
+        if os.path.exists(f"{ruta}.{i}"):
+            os.replace(f"{ruta}.{i}", f"{ruta}.{i + 1}")
+    if copias > 0:
+        os.replace(ruta, f"{ruta}.1")
+    else:
+        os.remove(ruta)
+
+
+def finalizar_ejecucion(ejecucion, ruta_log=RUTA_LOG, ruta_prometheus=RUTA_PROMETHEUS):
+    """Cierra la ejecución: añade una línea JSON al log y reescribe el fichero de Prometheus."""
+    ejecucion.duracion = time.time() - ejecucion.inicio
+    obtener_metricas().registrar("total", ejecucion.duracion)
+    _EJECUCION.set(None)
+    try:
+        if ruta_log:
+            with _LOCK_LOG:
+                _rotar_log(ruta_log)
+                with open(ruta_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(ejecucion.como_dict(), ensure_ascii=False) + "\n")
+        if ruta_prometheus:
+            tmp = f"{ruta_prometheus}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(obtener_metricas().prometheus())
+            os.replace(tmp, ruta_prometheus)
+    except OSError:
+        pass
+    return ejecucion
+
+
+@contextmanager
+def ejecucion_aparte(origen, ruta_log=RUTA_LOG, ruta_prometheus=RUTA_PROMETHEUS):
+    """
+    Trabajo fuera de una ejecución completa (el rerun temporizado de un
+    fragmento) registrado como ejecución propia: una línea más en el log.
+    Al salir se recupera la ejecución que hubiera en curso.
+    """
+    anterior = _EJECUCION.get()
+    ejecucion = iniciar_ejecucion(origen)
+    try:
+        yield ejecucion
+    finally:
+        finalizar_ejecucion(ejecucion, ruta_log, ruta_prometheus)
+        _EJECUCION.set(anterior)
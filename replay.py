@@ -0,0 +1,125 @@
+"""
+Reproducción acelerada de barras grabadas a través del pipeline de alertas.
+
+Pasa las barras de 1h por el mismo camino que el daemon (remuestreo, motor
+de indicadores, señal y cruces) cierre H4 tras cierre H4 con un reloj
+simulado, mide el rendimiento sostenido y compara las alertas emitidas con
+los cruces calculados de una vez sobre las H4 cerradas.
+
+    python replay.py --grabar GC=F SI=F --datos grabaciones    # grabar 1h de Yahoo
+    python replay.py --datos grabaciones --dias 180
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from alert_daemon import BARRA_H4, PERIODO_BASE, DaemonAlertas, proximo_cierre_h4
+from datos import ProveedorReplay, descargar_yahoo, duracion_periodo, guardar_grabacion
+from temporalidades import agregar
+
+PARAMS = {
+    "adr_period": 14,
+    "ema_fast": 5,
+    "ema_slow": 15,
+    "lrs_period": 9,
+    "min_ema_dist": 0.10,
+    "min_ema_slope": 0.03,
+    "max_adr_use": 0.60,
+}
+
+
+def reproducir(proveedor, symbols, params, desde, hasta, retraso=60):
+    """
+    Un ciclo del daemon tras cada cierre H4 entre `desde` y `hasta`.
+    Devuelve (alertas {symbol: [(tipo, barra)]}, ciclos, primer instante, último instante).
+    """
+    alertas = {symbol: [] for symbol in symbols}
+
+    def notificar(texto, clave=None):
+        symbol, tipo, barra = clave.split(":", 2)
+        alertas[symbol].append((tipo, pd.Timestamp(barra)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon = DaemonAlertas(symbols, params, os.path.join(tmp, "estado.json"),
+                               cargar=lambda symbol, interval, period: proveedor.descargar(symbol, interval, period=period),
+                               ruta_diario=os.path.join(tmp, "diario.sqlite"))
+        daemon.notificar = notificar
+        ahora = proximo_cierre_h4(pd.Timestamp(desde)) + pd.Timedelta(seconds=retraso)
+        primero, ciclos = ahora, 0
+        while ahora <= hasta:
+            proveedor.fijar(ahora)
+            daemon.ciclo(ahora)
+            ciclos += 1
+            ultimo = ahora
+            ahora = proximo_cierre_h4(ahora) + pd.Timedelta(seconds=retraso)
+    return alertas, ciclos, primero, ultimo
+
+
+def cruces_referencia(base, params, primero, ultimo):
+    """Cruces entre H4 cerradas consecutivas, calculados de una vez (lo que debería alertar el daemon)."""
+    base = base[(base.index >= primero - duracion_periodo(PERIODO_BASE)) & (base.index + pd.Timedelta("1h") <= ultimo)]
+    h4 = agregar(base, "H4")[0]
+    cerradas = h4[h4.index + BARRA_H4 <= ultimo]
+    rapida = cerradas["Close"].ewm(span=params["ema_fast"]).mean().to_numpy()
+    lenta = cerradas["Close"].ewm(span=params["ema_slow"]).mean().to_numpy()
+    alza = (rapida[:-1] <= lenta[:-1]) & (rapida[1:] > lenta[1:])
+    baja = (rapida[:-1] >= lenta[:-1]) & (rapida[1:] < lenta[1:])
+    # El daemon no compara la primera barra que evalúa (no tiene estado previo)
+    primera = cerradas.index[cerradas.index + BARRA_H4 <= primero][-1]
+    indices = cerradas.index[1:]
+    cruces = [("alza", b) for b in indices[alza]] + [("baja", b) for b in indices[baja]]
+    return sorted((c for c in cruces if c[1] > primera), key=lambda c: c[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay acelerado del pipeline de alertas")
+    parser.add_argument("--datos", default="grabaciones", help="Directorio de grabaciones {symbol}_{interval}.csv")
+    parser.add_argument("--grabar", nargs="+", metavar="SYMBOL", help="Descargar 1h de Yahoo y grabar")
+    parser.add_argument("--periodo", default="720d", help="Periodo a grabar")
+    parser.add_argument("--symbols", nargs="+", help="Símbolos a reproducir (por defecto todos los grabados)")
+    parser.add_argument("--dias", type=int, default=None, help="Días a reproducir (por defecto, todo tras el calentamiento)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.grabar:
+        for symbol in args.grabar:
+            ruta = guardar_grabacion(descargar_yahoo(symbol, "1h", period=args.periodo), args.datos, symbol, "1h")
+            print(f"Grabado {ruta}")
+        return
+
+    proveedor = ProveedorReplay.desde_directorio(args.datos)
+    symbols = args.symbols or sorted(s for s, i in proveedor.series if i == "1h")
+    series = {s: proveedor.series[(s, "1h")] for s in symbols}
+    inicio = max(df.index[0] for df in series.values()) + duracion_periodo(PERIODO_BASE)
+    fin = min(df.index[-1] for df in series.values()) + pd.Timedelta("1h")
+    if args.dias:
+        fin = min(fin, inicio + pd.Timedelta(days=args.dias))
+
+    t = time.perf_counter()
+    alertas, ciclos, primero, ultimo = reproducir(proveedor, {s: s for s in symbols}, PARAMS, inicio, fin)
+    segundos = time.perf_counter() - t
+
+    barras = sum(int(((df.index >= primero) & (df.index < ultimo)).sum()) for df in series.values())
+    simulado = (ultimo - primero).total_seconds()
+    print(f"{ciclos} ciclos, {barras} barras de 1h en {segundos:.1f}s: "
+          f"{barras / segundos:,.0f} barras/s, x{simulado / segundos:,.0f} tiempo real")
+
+    errores = 0
+    for symbol in symbols:
+        esperadas = cruces_referencia(series[symbol], PARAMS, primero, ultimo)
+        emitidas = alertas[symbol]
+        ok = emitidas == esperadas
+        errores += not ok
+        print(f"{symbol}: {len(emitidas)} alertas, {len(esperadas)} esperadas -> {'OK' if ok else 'DIFERENCIAS'}")
+        if not ok:
+            for cruce in sorted(set(emitidas) ^ set(esperadas), key=lambda c: c[1])[:10]:
+                print("   ", "sobra" if cruce in emitidas else "falta", cruce[0], cruce[1])
+    raise SystemExit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# ================= MONTE CARLO =================
+def _simular_bloque(rng, m, K, u0, rr, umbral, sel, columnas):
+    """
+    Simula m trayectorias; devuelve (conteos, tiempo de ruina, max drawdown).
+
+    Las matrices son (operación, trayectoria) y las acumulaciones se hacen
+    fila a fila con `out=`: cada paso es una operación vectorizada sobre las m
+    trayectorias (numpy.ufunc.accumulate recorre elemento a elemento y es
+    varias veces más lento).
+    """
+    n = K * m
+    # Cuatro aciertos de 16 bits por cada número de 64 bits del generador
+    gana = rng.bit_generator.random_raw((n + 3) // 4).view(np.uint16)[:n].reshape(K, m) < umbral
+    ganadas = np.empty((K, m), dtype=np.int16 if K < 32768 else np.int32)
+    ganadas[0] = gana[0]
+    for k in range(1, K):
+        np.add(ganadas[k - 1], gana[k], out=ganadas[k])
+    del gana
+
+    # Capital en unidades de riesgo: C0/R + (rr + 1) * W - k
+    cap = np.multiply(ganadas, np.float32(rr + 1), dtype=np.float32)
+    cap += (np.float32(u0) - np.arange(1, K + 1, dtype=np.float32))[:, None]
+    ganadas = ganadas[sel]
+
+    # En cada fila queda el mínimo hasta ese paso de capital / pico: <= 0 desde la ruina
+    pico = np.full(m, np.float32(u0))
+    for k in range(K):
+        np.maximum(pico, cap[k], out=pico)
+        np.divide(cap[k], pico, out=cap[k])
+        if k:
+            np.minimum(cap[k - 1], cap[k], out=cap[k])
+    max_dd = np.clip(1 - cap[-1], 0.0, 1.0)
+
+    # Primera operación con capital <= 0: bisección sobre las columnas (no crecientes) arruinadas
+    arruinadas = np.flatnonzero(cap[-1] <= 0)
+    bajo, alto = np.zeros(len(arruinadas), dtype=np.int64), np.full(len(arruinadas), K - 1)
+    while (bajo < alto).any():
+        medio = (bajo + alto) // 2
+        caida = cap[medio, arruinadas] <= 0
+        alto = np.where(caida, medio, alto)
+        bajo = np.where(caida, bajo, medio + 1)
+    tiempo_ruina = bajo + 1
+
+    # Columna 0 = arruinada, columna w + 1 = w operaciones ganadas
+    conteos = np.zeros((len(sel) + 1, columnas), dtype=np.int64)
+    for fila, (w, minimo) in enumerate(zip(ganadas, cap[sel]), start=1):
+        vivas = minimo > 0
+        conteos[fila, 0] = m - np.count_nonzero(vivas)
+        conteos[fila, 1:] = np.bincount(w[vivas], minlength=columnas - 1)
+    return conteos.ravel(), tiempo_ruina, max_dd
+
+
+def simular_montecarlo(capital, riesgo, rr, win_rate, n_trades, n_paths=100_000,
+                       percentiles=(5, 25, 50, 75, 95), puntos=200, seed=None):
+    """
+    Monte Carlo del modelo de la calculadora: cada operación gana `riesgo * rr`
+    con probabilidad `win_rate` o pierde `riesgo`. La ruina (capital <= 0) es
+    absorbente en 0.
+
+    Las trayectorias se simulan por bloques como matrices (operación ×
+    trayectoria, un bloque por hilo, NumPy libera el GIL): el capital tras k operaciones con W ganadas es
+    C0/R + (rr + 1) * W - k en unidades de riesgo, así que basta con la suma
+    acumulada de aciertos. Las bandas no necesitan guardar trayectorias: en
+    cada paso se cuenta cuántas tienen W ganadas (o están arruinadas) y los
+    percentiles salen de esos conteos.
+
+    Devuelve un dict con `pasos`, `bandas` {percentil: array}, `media`,
+    `prob_ruina`, `tiempo_ruina` (paso de ruina de las trayectorias
+    arruinadas), `max_drawdown` (fracción del pico, por trayectoria) y
+    `capital_final` (valores, frecuencias).
+    """
+    u0 = capital / riesgo
+    K = int(n_trades)
+    pasos = np.unique(np.linspace(0, K, min(puntos, K) + 1).round().astype(np.int64))
+    # Aciertos con enteros de 16 bits: más rápido que comparar floats
+    umbral = int(round(win_rate * 65536))
+    columnas = K + 2
+
+    # Unos 2M de elementos por bloque, pero filas de al menos 8192 trayectorias: con K grande pesa el bucle por fila
+    bloque = max(8192, 2_000_000 // K)
+    tamaños = [min(bloque, n_paths - i) for i in range(0, n_paths, bloque)]
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(tamaños))]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        partes = list(pool.map(
+            lambda args: _simular_bloque(args[0], args[1], K, u0, rr, umbral, pasos[1:] - 1, columnas),
+            zip(rngs, tamaños)))
+
+    conteos = np.sum([p[0] for p in partes], axis=0).reshape(len(pasos), columnas)
+    conteos[0, 1] = n_paths
+    tiempo_ruina = np.concatenate([p[1] for p in partes])
+    max_drawdown = np.concatenate([p[2] for p in partes])
+
+    # Capital (en dinero) de cada columna para cada paso
+    w = np.arange(K + 1)
+    valores = np.zeros((len(pasos), columnas))
+    valores[:, 1:] = np.where(w[None, :] <= pasos[:, None],
+                              (u0 + (rr + 1) * w[None, :] - pasos[:, None]) * riesgo, 0.0)
+
+    acumulado = np.cumsum(conteos, axis=1)
+    filas = np.arange(len(pasos))
+    bandas = {}
+    for q in percentiles:
+        objetivo = max(q / 100 * n_paths, 1)
+        bandas[q] = valores[filas, (acumulado >= objetivo).argmax(axis=1)]
+
+    finales = conteos[-1] > 0
+    return {
+        "pasos": pasos,
+        "bandas": bandas,
+        "media": (valores * conteos).sum(axis=1) / n_paths,
+        "prob_ruina": len(tiempo_ruina) / n_paths,
+        "tiempo_ruina": tiempo_ruina,
+        "max_drawdown": max_drawdown,
+        "capital_final": (valores[-1, finales], conteos[-1, finales]),
+    }
+
+
+# ================= RUINA EXACTA =================
+# Estados con probabilidad por debajo de esta fracción de la mayor: son del orden del redondeo de la FFT
+RECORTE = 1e-15
+
+
+def _tabla_binomial(n_max, win_rate):
+    """
+    P(d ganadas en n operaciones) en una tabla plana: está en
+    `origen + n * columnas + d` para -n_max <= n <= n_max y
+    -n_max <= d <= 2 * n_max + 1, y vale 0 fuera de 0 <= d <= n, así que se
+    puede indexar sin comprobar los límites. Devuelve (tabla, columnas, origen).
+    """
+    n = np.arange(n_max + 1)
+    lf = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, n_max + 1)))))
+    d = n[None, :]
+    log = (lf[n][:, None] - lf[d] - lf[np.abs(n[:, None] - d)] + d * np.log(win_rate)
+           + (n[:, None] - d) * np.log1p(-win_rate))
+    columnas = 3 * n_max + 2
+    tabla = np.zeros((2 * n_max + 1, columnas))
+    tabla[n_max:, n_max:2 * n_max + 1] = np.where(d <= n[:, None], np.exp(log), 0.0)
+    return tabla.ravel(), columnas, n_max * columnas + n_max
+
+
+def _convolucion(f, g):
+    """f * g por FFT (sin valores negativos: el ruido de redondeo por debajo de 0 se recorta)."""
+    n = len(f) + len(g) - 1
+    tamaño = 1 << (n - 1).bit_length()
+    r = np.fft.irfft(np.fft.rfft(f, tamaño) * np.fft.rfft(g, tamaño), tamaño)[:n]
+    return np.maximum(r, 0.0, out=r)
+
+
+def ruina_exacta(capital, riesgo, rr, win_rate, n_trades, percentiles=(5, 25, 50, 75, 95), bloque=None):
+    """
+    Probabilidad de ruina exacta en `n_trades` operaciones y distribución del
+    capital, para el mismo modelo que `simular_montecarlo` (gana `riesgo * rr`
+    con probabilidad `win_rate` o pierde `riesgo`; ruina si capital <= 0).
+
+    Cadena de Markov sobre W, las operaciones ganadas: tras k operaciones el
+    capital es C0/R + (rr + 1) * W - k en unidades de riesgo. Con W ganadas la
+    ruina solo puede llegar en la operación T(W) = ⌈C0/R + (rr + 1) * W⌉, así
+    que la probabilidad de arruinarse por primera vez en cada uno de esos
+    puntos cumple
+        a_W = P(W ganadas en T(W)) - Σ_{V<W} a_V · P(W - V ganadas en T(W) - T(V)),
+    un sistema triangular. Se avanza en bloques de `bloque` operaciones: la
+    distribución se convoluciona (FFT) con la binomial del bloque y se le resta
+    lo que sale por los a_W del bloque, que solo dependen de los estados junto
+    a la barrera. Sin muestreo: el error es el de redondeo (del orden de 1e-15
+    en probabilidad absoluta).
+
+    Devuelve un dict con `pasos` (final de cada bloque), `bandas` {percentil:
+    array}, `media`, `prob_ruina`, `ruina_acumulada` (en cada paso),
+    `tiempo_ruina` (operación, probabilidad) y `capital_final` (valores,
+    probabilidades; la ruina cuenta como capital 0).
+    """
+    u0 = capital / riesgo
+    if u0 <= 0 or rr <= 0 or not 0 < win_rate < 1:
+        raise ValueError("Capital, riesgo y ratio positivos y win rate entre 0 y 1")
+    K = int(n_trades)
+    bloque = min(int(bloque or max(64, 2 * int(np.sqrt(K)))), max(K, 1))
+    P, columnas, origen = _tabla_binomial(bloque, win_rate)
+    # Operación en la que se arruina quien lleva W ganadas (la tolerancia absorbe el redondeo de rr)
+    T = np.ceil(u0 + (rr + 1) * np.arange(K + 1) - 1e-9).astype(np.int64)
+    T = T[:np.searchsorted(T, K, side="right")]
+    # Con u = T * columnas + W, el índice de P(W - V ganadas en T(W) - T(V)) es origen + u_W - u_V
+    u = T * columnas + np.arange(len(T))
+
+    # P(vivo con W ganadas) tras k operaciones, para W = base .. base + len(f) - 1
+    f, base = np.ones(1), 0
+    a = np.zeros(len(T))
+    inversas = {}
+    pasos, distribuciones = [0], [(f, base)]
+    k, w = 0, 0
+    while k < K:
+        k2 = min(k + bloque, K)
+        nuevo = _convolucion(f, P[origen + (k2 - k) * columnas + np.arange(k2 - k + 1)])
+        w2 = int(np.searchsorted(T, k2, side="right"))
+        # Solo los estados con W en [w, w2) pueden arruinarse en este bloque
+        xs = np.arange(max(w, base), min(w2, base + len(f)))
+        if len(xs):
+            # Por debajo del primer estado vivo no hay ruina posible
+            puntos = slice(xs[0], w2)
+            h = P[np.subtract.outer(u[puntos] + (origen - k * columnas), xs)] @ f[xs - base]
+            # El sistema solo depende de la separación entre los puntos: se repite de un bloque a otro
+            clave = (T[puntos] - T[xs[0]]).tobytes()
+            if clave not in inversas:
+                inversas[clave] = np.linalg.inv(P[np.subtract.outer(u[puntos] + origen, u[puntos])])
+            a[puntos] = inversas[clave] @ h
+            # Lo que habría seguido tras cada ruina hasta el final del bloque
+            x = np.arange(xs[0], min(w2 + k2 - T[xs[0]], base + len(nuevo)))
+            nuevo[x - base] -= a[puntos] @ P[np.add.outer(origen + k2 * columnas - u[puntos], x)]
+            np.maximum(nuevo, 0.0, out=nuevo)
+        nuevo[:max(0, w2 - base)] = 0.0
+        w = max(w, w2)
+        vivos = np.flatnonzero(nuevo > nuevo.max(initial=0.0) * RECORTE)
+        # Con lo que sigue vivo por debajo del redondeo, todo lo demás es ruina
+        if len(vivos) and nuevo.sum() >= RECORTE:
+            f, base = nuevo[vivos[0]:vivos[-1] + 1], base + int(vivos[0])
+        else:
+            f = np.zeros(1)
+        k = k2
+        pasos.append(k)
+        distribuciones.append((f, base))
+
+    pasos = np.array(pasos)
+    ruina_acumulada = np.concatenate(([0.0], np.cumsum(a)))[np.searchsorted(T, pasos, side="right")]
+    bandas = {q: np.zeros(len(pasos)) for q in percentiles}
+    media = np.zeros(len(pasos))
+    for i, (paso, (dist, desde)) in enumerate(zip(pasos, distribuciones)):
+        # El capital crece con W: con la ruina (capital 0) delante, la distribución ya está ordenada
+        valores = (u0 + (rr + 1) * (desde + np.arange(len(dist))) - paso) * riesgo
+        acumulado = ruina_acumulada[i] + np.cumsum(dist)
+        media[i] = dist @ valores
+        for q in percentiles:
+            objetivo = q / 100 * acumulado[-1]
+            if objetivo > ruina_acumulada[i]:
+                bandas[q][i] = valores[min(int(np.searchsorted(acumulado, objetivo)), len(dist) - 1)]
+
+    vivos = f > 0
+    prob_ruina = float(ruina_acumulada[-1])
+    return {
+        "pasos": pasos,
+        "bandas": bandas,
+        "media": media,
+        "prob_ruina": prob_ruina,
+        "ruina_acumulada": ruina_acumulada,
+        "tiempo_ruina": (T[a > 0], a[a > 0]),
+        "capital_final": (np.concatenate(([0.0], (u0 + (rr + 1) * (base + np.flatnonzero(vivos)) - K) * riesgo)),
+                          np.concatenate(([prob_ruina], f[vivos]))),
+    }
@@ -0,0 +1,214 @@
+"""
+Escáner de la regla de señal H4 sobre una lista de símbolos.
+
+Cada símbolo ocupa una fila de un panel símbolos × tiempo con sus últimas
+`ventana` barras H4 (alineadas a la derecha: la última columna es la barra
+en curso de cada símbolo) y sus días del ADR. EMAs, pendiente, LRS, ADR y
+consumo se calculan para todo el panel con operaciones 2D, así que el coste
+por símbolo es copiar sus barras a su fila cuando cambian.
+
+    from scanner import PanelH4, escanear
+    ranking, errores = escanear(WATCHLIST, params)
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datos import cargar_en_paralelo, duracion_periodo, obtener_barras_compartidas
+from metricas import medir
+from temporalidades import RemuestreoSesion, etiquetas
+
+# ================= CONFIG =================
+# Con spans <= 30 el peso del inicio de la EMA tras 300 barras es < 1e-8
+VENTANA_H4 = 300
+# Días que entran en el ADR (los 3 últimos meses, como en el monitor)
+PERIODO_ADR = "3mo"
+DIAS_D1 = 93
+PERIODO_BASE = "6mo"
+SEÑALES_ACTIVAS = ("COMPRAR", "VENDER")
+
+WATCHLIST = [
+    # Metales y energía
+    "GC=F", "SI=F", "HG=F", "PL=F", "PA=F", "CL=F", "BZ=F", "NG=F", "RB=F", "HO=F",
+    # Agrícolas
+    "ZC=F", "ZW=F", "ZS=F", "ZM=F", "ZL=F", "KC=F", "SB=F", "CC=F", "CT=F", "LE=F", "HE=F",
+    # Índices y tipos
+    "ES=F", "NQ=F", "YM=F", "RTY=F", "ZB=F", "ZN=F", "ZF=F", "ZT=F", "DX-Y.NYB",
+    # Divisas
+    "EURUSD=X", "GBPUSD=X", "USDJPY=X", "USDCHF=X", "AUDUSD=X", "NZDUSD=X", "USDCAD=X",
+    "EURGBP=X", "EURJPY=X", "GBPJPY=X", "EURCHF=X", "AUDJPY=X", "USDMXN=X", "USDZAR=X",
+    "USDTRY=X", "USDCNH=X", "USDSEK=X", "USDNOK=X",
+]
+
+
+def _vacio(filas, columnas, valor=np.nan, dtype=np.float64):
+    return np.full((filas, columnas), valor, dtype=dtype)
+
+
+class PanelH4:
+    """
+    Barras H4 y D1 de muchos símbolos en arrays (símbolos × tiempo).
+
+    `actualizar` solo reescribe las filas cuyos datos han cambiado; los
+    símbolos con menos historia quedan con NaN a la izquierda. `evaluar`
+    aplica la regla de `evaluar_senal` a la última barra de todas las filas
+    a la vez. El consumo del ADR es el rango de la sesión en curso, como en
+    el backtest.
+    """
+
+    def __init__(self, ventana=VENTANA_H4, dias=DIAS_D1):
+        self.ventana = ventana
+        self.dias = dias
+        self._lock = threading.Lock()
+        self.symbols = []
+        self._filas = {}
+        self._firmas = {}
+        self._crear(0)
+
+    def _crear(self, n):
+        self.close = _vacio(n, self.ventana)
+        self.high = _vacio(n, self.ventana)
+        self.low = _vacio(n, self.ventana)
+        # Sesión (D1) de cada barra H4, en ns; -1 en el relleno
+        self.dia = _vacio(n, self.ventana, -1, np.int64)
+        self.barra = np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+        self.d_high = _vacio(n, self.dias)
+        self.d_low = _vacio(n, self.dias)
+        self.d_close = _vacio(n, self.dias)
+
+    def _crecer(self, nuevos):
+        anterior = {k: getattr(self, k) for k in ("close", "high", "low", "dia", "barra",
+                                                  "d_high", "d_low", "d_close")}
+        n = len(self.symbols)
+        self._crear(n + len(nuevos))
+        for nombre, valores in anterior.items():
+            getattr(self, nombre)[:n] = valores
+        for symbol in nuevos:
+            self._filas[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+
+    def actualizar(self, marcos):
+        """`marcos`: {symbol: {"H4": df, "D1": df}}. Devuelve cuántas filas se han reescrito."""
+        with self._lock:
+            nuevos = [s for s in marcos if s not in self._filas]
+            if nuevos:
+                self._crecer(nuevos)
+            escritas = 0
+            for symbol, m in marcos.items():
+                df_h4, df_d = m["H4"], m["D1"]
+                if df_h4.empty or df_d.empty:
+                    continue
+                firma = (len(df_h4), df_h4.index[-1], tuple(df_h4.iloc[-1]), len(df_d), tuple(df_d.iloc[-1]))
+                if self._firmas.get(symbol) == firma:
+                    continue
+                self._escribir(self._filas[symbol], df_h4, df_d)
+                self._firmas[symbol] = firma
+                escritas += 1
+            return escritas
+
+    def _escribir(self, fila, df_h4, df_d):
+        h4 = df_h4.iloc[-self.ventana:]
+        k = self.ventana - len(h4)
+        for nombre, columna in (("close", "Close"), ("high", "High"), ("low", "Low")):
+            destino = getattr(self, nombre)
+            destino[fila, :k] = np.nan
+            destino[fila, k:] = h4[columna].to_numpy(dtype=np.float64)
+        self.dia[fila, :k] = -1
+        self.dia[fila, k:] = etiquetas(h4.index, "D1").asi8
+        self.barra[fila] = h4.index[-1].tz_convert("UTC").tz_localize(None).asm8
+
+        d1 = df_d[df_d.index >= df_d.index[-1] - duracion_periodo(PERIODO_ADR)].iloc[-self.dias:]
+        k = self.dias - len(d1)
+        for nombre, columna in (("d_high", "High"), ("d_low", "Low"), ("d_close", "Close")):
+            destino = getattr(self, nombre)
+            destino[fila, :k] = np.nan
+            destino[fila, k:] = d1[columna].to_numpy(dtype=np.float64)
+
+    def evaluar(self, ema_fast, ema_slow, lrs_period, adr_period, min_ema_dist, min_ema_slope,
+                max_adr_use, symbols=None):
+        """
+        Señal y métricas de la última barra de cada símbolo (los de `symbols`,
+        o todos). Devuelve un DataFrame por símbolo con las columnas de
+        `evaluar_senal`, ordenado con las señales activas primero y, dentro,
+        por gap entre EMAs.
+        """
+        with self._lock:
+            symbols = [s for s in (self.symbols if symbols is None else symbols) if s in self._filas]
+            filas = np.array([self._filas[s] for s in symbols], dtype=np.int64)
+            close, high, low, dia = self.close[filas], self.high[filas], self.low[filas], self.dia[filas]
+            barra = self.barra[filas]
+            d_high, d_low, d_close = self.d_high[filas], self.d_low[filas], self.d_close[filas]
+        if not len(filas):
+            return pd.DataFrame()
+
+        # EMAs con el mismo recurrente que el monitor: una columna por símbolo
+        emas = {s: pd.DataFrame(close.T).ewm(span=s).mean().to_numpy().T for s in {ema_fast, ema_slow}}
+        cierre = close[:, -1]
+        ema5, ema15 = emas[ema_fast][:, -1], emas[ema_slow][:, -1]
+        ema15_prev = emas[ema_slow][:, -2]
+
+        # LRS de las últimas `lrs_period` barras (NaN si falta alguna)
+        y = close[:, -lrs_period:]
+        x = np.arange(lrs_period) - (lrs_period - 1) / 2
+        lrs = ((y - y.mean(axis=1, keepdims=True)) @ x) / (x @ x)
+        lrs = np.where(np.isnan(lrs), 0.0, lrs)
+
+        # ADR: EWM del True Range de los días del panel
+        prev_close = np.concatenate([np.full((len(filas), 1), np.nan), d_close[:, :-1]], axis=1)
+        tr = np.maximum(d_high - d_low, np.maximum(np.abs(d_high - prev_close), np.abs(d_low - prev_close)))
+        adr = pd.DataFrame(tr.T).ewm(span=adr_period).mean().to_numpy()[-1]
+
+        # Consumo: rango de la sesión de la última barra
+        hoy = dia == dia[:, -1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rango = np.nanmax(np.where(hoy, high, np.nan), axis=1) - np.nanmin(np.where(hoy, low, np.nan), axis=1)
+            consumo_adr = rango / adr
+            ema_dist_pct = np.abs(ema5 - ema15) / cierre * 100
+            ema_slope_pct = np.abs(ema15 - ema15_prev) / cierre * 100
+
+        filtros = (ema_dist_pct >= min_ema_dist) & (ema_slope_pct >= min_ema_slope) & (consumo_adr <= max_adr_use)
+        señal = np.where(filtros & (ema5 > ema15), "COMPRAR", np.where(filtros & (ema5 < ema15), "VENDER", "ESPERAR"))
+
+        res = pd.DataFrame({
+            "señal": señal,
+            "close": cierre,
+            "ema5": ema5,
+            "ema15": ema15,
+            "lrs": lrs,
+            "ema_dist_pct": ema_dist_pct,
+            "ema_slope_pct": ema_slope_pct,
+            "adr": adr,
+            "consumo_adr": consumo_adr,
+            "barra": pd.DatetimeIndex(barra).tz_localize("UTC"),
+        }, index=pd.Index(symbols, name="symbol"))
+        res["activa"] = res["señal"].isin(SEÑALES_ACTIVAS)
+        res = res.sort_values(["activa", "ema_dist_pct"], ascending=False, kind="stable")
+        return res.drop(columns="activa")
+
+
+def escanear(symbols, params, panel=None, remuestreo=None, cargar=obtener_barras_compartidas,
+             period=PERIODO_BASE, max_concurrencia=8):
+    """
+    Carga la serie de 1h de cada símbolo, remuestrea a H4/D1, actualiza el
+    panel y evalúa la señal. `params` lleva las claves de los sliders
+    (ema_fast, ema_slow, lrs_period, adr_period, min_ema_dist,
+    min_ema_slope, max_adr_use). Devuelve (ranking, errores por símbolo).
+    """
+    panel = panel or PanelH4()
+    remuestreo = remuestreo or RemuestreoSesion()
+    with medir("escaner_carga"):
+        peticiones = {symbol: (symbol, "1h", period) for symbol in symbols}
+        datos, errores = cargar_en_paralelo(peticiones, cargar=cargar, max_concurrencia=max_concurrencia)
+    with medir("escaner_remuestreo"):
+        marcos = {}
+        for symbol, df in datos.items():
+            m = remuestreo.actualizar(symbol, df)
+            if m is not None:
+                marcos[symbol] = m
+        panel.actualizar(marcos)
+    with medir("escaner_evaluacion"):
+        ranking = panel.evaluar(params["ema_fast"], params["ema_slow"], params["lrs_period"],
+                                params["adr_period"], params["min_ema_dist"], params["min_ema_slope"],
+                                params["max_adr_use"], symbols=[s for s in symbols if s in marcos])
+    return ranking, errores
@@ -0,0 +1,393 @@
+"""
+Ingesta en streaming de precios con la barra H4 en formación en vivo.
+
+Un feed enchufable (ticks o actualizaciones de 1 minuto) alimenta una cola
+asyncio acotada: si el consumidor no da abasto, el feed espera (contrapresión)
+en vez de acumular ticks. Cada tick actualiza en O(1) la barra H4 en
+formación de su símbolo, las EMAs y el LRS, y los cruces dentro de la barra
+se avisan en segundos en lugar de al siguiente sondeo. El estado de las
+barras cerradas se siembra con una sola descarga de 1h por símbolo, así que
+el streaming no añade carga al proveedor de sondeo.
+
+    python streaming.py --symbols GC=F:ORO SI=F:PLATA              # websocket de Yahoo
+    python streaming.py --simulado --segundos 60 --datos grabaciones
+
+Con el websocket de Yahoo los cruces se avisan por Telegram (--token y
+--chat-id, o TELEGRAM_TOKEN y TELEGRAM_CHAT_ID) y se anotan en el diario
+igual que en el daemon, así que no se repiten. Con --simulado o --datos
+solo se escriben en el log.
+"""
+import argparse
+import asyncio
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from alert_daemon import PERIODO_BASE, notificar_una_vez, proximo_cierre_h4
+from alertas import NotificadorTelegram, mensaje_cruce
+from datos import ProveedorReplay, cargar_en_paralelo, obtener_barras
+from diario import Diario, clave_params
+from indicadores import detectar_cruce, ema_paso, ema_peso, factor_ema, pendiente_sumas
+from metricas import obtener_metricas
+from temporalidades import RemuestreoSesion, etiquetas
+
+# ================= CONFIG =================
+MAX_COLA = 1000
+# `maximo`, `minimo` y `apertura` solo en las actualizaciones de 1 minuto; en los ticks son el precio
+Tick = namedtuple("Tick", "symbol instante precio volumen maximo minimo apertura", defaults=(0.0, None, None, None))
+
+log = logging.getLogger("streaming")
+
+
+class BarraViva:
+    """
+    Barra H4 en formación de un símbolo y el estado de sus indicadores tras
+    la última barra cerrada (mismo recurrente que `MotorIndicadores`).
+
+    `tick` actualiza OHLCV y calcula EMAs y LRS con el precio nuevo sin
+    tocar el estado de las cerradas. Cuando llega un tick de otra H4 se
+    pliega la barra en curso (coste fijo, `lrs_period` valores) y empieza la
+    siguiente.
+    """
+
+    def __init__(self, ema_fast, ema_slow, lrs_period):
+        self.spans = (ema_fast, ema_slow)
+        self.factores = (factor_ema(ema_fast), factor_ema(ema_slow))
+        self.lrs_period = lrs_period
+        self.emas = None  # ((media, peso), (media, peso)) tras la última cerrada
+        self.ventana = deque(maxlen=lrs_period - 1)
+        self.suma_y = 0.0
+        self.suma_jy = 0.0
+        self.inicio = None
+        self.cierre_ns = None
+        self.open = self.high = self.low = self.close = math.nan
+        self.volumen = 0.0
+        self.ultimo_ns = 0
+        self.vivas = None  # (ema rápida, ema lenta, lrs) con el último precio
+        self.avisados = set()  # tipos de cruce ya avisados en esta barra
+
+    def sembrar(self, df_h4):
+        """
+        Estado a partir de barras H4 (la última en formación), p. ej. las del
+        remuestreo. Si los ticks ya van por una barra posterior no se toca nada.
+        """
+        inicio = df_h4.index[-1]
+        if self.inicio is not None and inicio < self.inicio:
+            return False
+        cerradas = df_h4["Close"].to_numpy(dtype=np.float64)[:-1]
+        m = len(cerradas)
+        self.emas = None
+        if m:
+            serie = pd.Series(cerradas)
+            self.emas = tuple((float(serie.ewm(span=span).mean().iloc[-1]), ema_peso(m, factor))
+                              for span, factor in zip(self.spans, self.factores))
+        self.ventana.clear()
+        self.ventana.extend(cerradas[-(self.lrs_period - 1):])
+        self._sumas()
+        ultima = df_h4.iloc[-1]
+        if inicio == self.inicio:
+            # Misma barra: se conserva lo visto por los ticks y se amplía con lo descargado
+            self.high = max(self.high, float(ultima["High"]))
+            self.low = min(self.low, float(ultima["Low"]))
+        else:
+            self._abrir(inicio, float(ultima["Open"]))
+            self.high, self.low, self.close = float(ultima["High"]), float(ultima["Low"]), float(ultima["Close"])
+            self.volumen = float(ultima["Volume"])
+        # Los ticks anteriores a la barra en formación ya están en lo descargado
+        self.ultimo_ns = max(self.ultimo_ns, inicio.value)
+        self.vivas = self._indicadores(self.close)
+        return True
+
+    def _sumas(self):
+        valores = np.asarray(self.ventana, dtype=np.float64)
+        self.suma_y = float(valores.sum())
+        self.suma_jy = float(np.dot(np.arange(len(valores)), valores))
+
+    def _abrir(self, inicio, precio):
+        self.inicio = inicio
+        self.cierre_ns = proximo_cierre_h4(inicio).value
+        self.open = self.high = self.low = self.close = precio
+        self.volumen = 0.0
+        self.avisados = set()
+
+    def _plegar(self):
+        self.emas = self._emas(self.close)
+        self.ventana.append(self.close)
+        self._sumas()
+
+    def _emas(self, cierre):
+        if self.emas is None:
+            return (cierre, 1.0), (cierre, 1.0)
+        return tuple(ema_paso(media, peso, cierre, factor) for (media, peso), factor in zip(self.emas, self.factores))
+
+    def _indicadores(self, cierre):
+        (ema_r, _), (ema_l, _) = self._emas(cierre)
+        n = self.lrs_period
+        lrs = math.nan if len(self.ventana) < n - 1 else \
+            pendiente_sumas(n, self.suma_y + cierre, self.suma_jy + (n - 1) * cierre)
+        return ema_r, ema_l, lrs
+
+    def tick(self, instante_ns, precio, volumen=0.0, maximo=None, minimo=None, apertura=None):
+        """Aplica un tick; devuelve 'alza', 'baja' o None si las EMAs vivas cruzan por primera vez en la barra."""
+        if self.cierre_ns is None or instante_ns >= self.cierre_ns:
+            if self.cierre_ns is not None:
+                self._plegar()
+            inicio = etiquetas(pd.DatetimeIndex([pd.Timestamp(instante_ns, unit="ns", tz="UTC")]), "H4")[0]
+            self._abrir(inicio, precio if apertura is None else apertura)
+        self.high = max(self.high, precio if maximo is None else maximo)
+        self.low = min(self.low, precio if minimo is None else minimo)
+        self.close = precio
+        self.volumen += volumen
+        self.ultimo_ns = instante_ns
+        self.vivas = self._indicadores(precio)
+        if self.emas is None:
+            return None
+        tipo = detectar_cruce(self.emas[0][0], self.emas[1][0], self.vivas[0], self.vivas[1])
+        if tipo is None or tipo in self.avisados:
+            return None
+        self.avisados.add(tipo)
+        return tipo
+
+    def resumen(self):
+        ema_r, ema_l, lrs = self.vivas or (math.nan,) * 3
+        return {"barra": self.inicio, "open": self.open, "high": self.high, "low": self.low, "close": self.close,
+                "volume": self.volumen, "ema_rapida": ema_r, "ema_lenta": ema_l, "lrs": lrs,
+                "ultimo_tick": pd.Timestamp(self.ultimo_ns, unit="ns", tz="UTC") if self.ultimo_ns else None}
+
+
+# ================= FEEDS =================
+class FeedSimulado:
+    """
+    Paseo aleatorio por símbolo con reloj simulado: un tick por símbolo cada
+    `intervalo` segundos simulados, `velocidad` veces más rápido que el
+    tiempo real (None: sin esperas). Para probar sin conexión.
+    """
+
+    def __init__(self, precios, inicio=None, intervalo=1.0, volatilidad=0.0005, velocidad=1.0,
+                 max_ticks=None, semilla=None):
+        self.precios = dict(precios)
+        self.inicio = pd.Timestamp.now(tz="UTC") if inicio is None else pd.Timestamp(inicio)
+        self.intervalo = intervalo
+        self.volatilidad = volatilidad
+        self.velocidad = velocidad
+        self.max_ticks = max_ticks
+        self.rng = np.random.default_rng(semilla)
+
+    async def ticks(self, symbols):
+        precios = {s: self.precios.get(s, 100.0) for s in symbols}
+        t, paso = self.inicio.value, int(self.intervalo * 1e9)
+        emitidos = 0
+        while self.max_ticks is None or emitidos < self.max_ticks:
+            choques = self.rng.standard_normal(len(precios)) * self.volatilidad
+            for (symbol, precio), choque in zip(precios.items(), choques):
+                precios[symbol] = precio * math.exp(choque)
+                yield Tick(symbol, t, precios[symbol], float(self.rng.integers(1, 10)))
+            emitidos += len(precios)
+            t += paso
+            await asyncio.sleep(self.intervalo / self.velocidad if self.velocidad else 0)
+
+
+class FeedYahoo:
+    """Precios en vivo del websocket de Yahoo (`yfinance.AsyncWebSocket`)."""
+
+    def __init__(self, max_cola=100):
+        self.max_cola = max_cola
+
+    async def ticks(self, symbols):
+        import yfinance as yf
+        mensajes = asyncio.Queue(maxsize=self.max_cola)
+        ws = yf.AsyncWebSocket(verbose=False)
+        await ws.subscribe(list(symbols))
+        # El manejador espera a que haya sitio: la contrapresión llega hasta el socket
+        lector = asyncio.create_task(ws.listen(mensajes.put))
+        volumenes = {}
+        try:
+            while True:
+                msg = await mensajes.get()
+                symbol, precio = msg.get("id"), msg.get("price")
+                if symbol not in symbols or not precio:
+                    continue
+                # `day_volume` es acumulado: el tick lleva la diferencia
+                dia = float(msg.get("day_volume") or 0)
+                volumen = max(dia - volumenes.get(symbol, dia), 0.0)
+                volumenes[symbol] = dia
+                yield Tick(symbol, int(msg["time"]) * 1_000_000, float(precio), volumen)
+        finally:
+            lector.cancel()
+            await ws.close()
+
+
+# ================= INGESTA =================
+class IngestaStreaming:
+    """
+    Consume un feed con contrapresión y mantiene una `BarraViva` por símbolo.
+
+    `symbols` es {symbol: etiqueta} y `params` las claves de los sliders.
+    Los cruces en la barra en formación se pasan a `notificar(texto, clave)`
+    con la misma clave que el daemon (`symbol:tipo:barra`), así que el
+    `NotificadorTelegram` descarta el aviso repetido al cierre. Los ticks
+    fuera de orden se descartan. `resumen()` se puede leer desde otro hilo.
+    """
+
+    def __init__(self, feed, symbols, params, notificar=None, max_cola=MAX_COLA):
+        self.feed = feed
+        self.symbols = dict(symbols)
+        self.params = params
+        self.notificar = notificar
+        self.max_cola = max_cola
+        self.barras = {s: BarraViva(params["ema_fast"], params["ema_slow"], params["lrs_period"])
+                       for s in self.symbols}
+        self._lock = threading.Lock()
+        self.estadisticas = {"ticks": 0, "descartados": 0, "esperas": 0, "alertas": 0, "cola_max": 0}
+
+    def sembrar(self, symbol, df_h4):
+        if df_h4 is None or df_h4.empty:
+            return
+        with self._lock:
+            return self.barras[symbol].sembrar(df_h4)
+
+    def procesar(self, tick):
+        barra = self.barras.get(tick.symbol)
+        if barra is None:
+            return None
+        with self._lock:
+            if tick.instante < barra.ultimo_ns:
+                self.estadisticas["descartados"] += 1
+                return None
+            tipo = barra.tick(tick.instante, tick.precio, tick.volumen, tick.maximo, tick.minimo, tick.apertura)
+            self.estadisticas["ticks"] += 1
+        if tipo is not None:
+            self.estadisticas["alertas"] += 1
+            ema_r, ema_l, lrs = barra.vivas
+            p = self.params
+            clave = f"{tick.symbol}:{tipo}:{barra.inicio.isoformat()}"
+            log.info("Cruce %s en %s dentro de la barra %s", tipo, self.symbols[tick.symbol], barra.inicio)
+            if self.notificar is not None:
+                self.notificar(mensaje_cruce(tipo, self.symbols[tick.symbol], tick.precio, p["ema_fast"],
+                                             p["ema_slow"], p["lrs_period"], 0.0 if math.isnan(lrs) else lrs,
+                                             en_formacion=True), clave)
+        return tipo
+
+    def resumen(self):
+        with self._lock:
+            return {s: b.resumen() for s, b in self.barras.items()}
+
+    async def _producir(self, cola):
+        async for tick in self.feed.ticks(self.symbols):
+            if cola.full():
+                self.estadisticas["esperas"] += 1
+            await cola.put((tick, time.perf_counter()))
+            self.estadisticas["cola_max"] = max(self.estadisticas["cola_max"], cola.qsize())
+
+    async def _consumir(self, cola):
+        metricas = obtener_metricas()
+        while True:
+            tick, llegada = await cola.get()
+            try:
+                self.procesar(tick)
+            except Exception as e:
+                log.exception("Error procesando %s: %s", tick.symbol, e)
+            finally:
+                # Desde que el feed entrega el tick hasta que está aplicado
+                metricas.registrar("streaming_latencia", time.perf_counter() - llegada)
+                cola.task_done()
+
+    async def ejecutar(self, duracion=None):
+        """Corre hasta que se agota el feed o pasan `duracion` segundos."""
+        cola = asyncio.Queue(maxsize=self.max_cola)
+        consumidor = asyncio.create_task(self._consumir(cola))
+        productor = asyncio.create_task(self._producir(cola))
+        try:
+            await asyncio.wait_for(asyncio.shield(productor), duracion)
+        except asyncio.TimeoutError:
+            productor.cancel()
+        await cola.join()
+        consumidor.cancel()
+
+
+def sembrar_desde_proveedor(ingesta, period=PERIODO_BASE, cargar=obtener_barras):
+    """Siembra la ingesta con la serie de 1h de cada símbolo (una descarga por símbolo)."""
+    remuestreo = RemuestreoSesion(marcos=("H4",))
+    peticiones = {symbol: (symbol, "1h", period) for symbol in ingesta.symbols}
+    datos, errores = cargar_en_paralelo(peticiones, cargar=cargar)
+    for symbol, df in datos.items():
+        marcos = remuestreo.actualizar(symbol, df)
+        if marcos is not None:
+            ingesta.sembrar(symbol, marcos["H4"])
+    return datos, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta en streaming con la H4 en formación en vivo")
+    parser.add_argument("--symbols", nargs="+", default=["GC=F:ORO", "SI=F:PLATA"], help="Lista SYMBOL:ETIQUETA")
+    parser.add_argument("--ema-fast", type=int, default=5)
+    parser.add_argument("--ema-slow", type=int, default=15)
+    parser.add_argument("--lrs-period", type=int, default=9)
+    parser.add_argument("--simulado", action="store_true", help="Feed simulado en lugar del websocket de Yahoo")
+    parser.add_argument("--velocidad", type=float, default=1.0, help="Feed simulado: múltiplo del tiempo real (0: sin esperas)")
+    parser.add_argument("--datos", help="Sembrar desde grabaciones en lugar de descargar")
+    parser.add_argument("--segundos", type=float, default=None, help="Duración (por defecto, sin límite)")
+    parser.add_argument("--token", default=os.environ.get("TELEGRAM_TOKEN"))
+    parser.add_argument("--chat-id", default=os.environ.get("TELEGRAM_CHAT_ID"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    symbols = dict(s.split(":", 1) if ":" in s else (s, s) for s in args.symbols)
+    params = {"ema_fast": args.ema_fast, "ema_slow": args.ema_slow, "lrs_period": args.lrs_period}
+    # Avisos solo con precios reales: con el feed simulado o sembrado de grabaciones, solo al log
+    diario = notificador = None
+    notificar = None
+    if not args.simulado and not args.datos:
+        diario = Diario()
+        notificador = NotificadorTelegram(args.token) if args.token and args.chat_id else None
+        notificar = functools.partial(notificar_una_vez, diario, clave_params(args.ema_fast, args.ema_slow, args.lrs_period),
+                                      notificador, args.chat_id, origen="streaming")
+    ingesta = IngestaStreaming(None, symbols, params, notificar=notificar)
+    if args.datos:
+        proveedor = ProveedorReplay.desde_directorio(args.datos)
+        proveedor.fijar(max(df.index[-1] for df in proveedor.series.values()) + pd.Timedelta("1h"))
+        datos, errores = sembrar_desde_proveedor(
+            ingesta, cargar=lambda symbol, interval, period: proveedor.descargar(symbol, interval, period=period))
+    else:
+        datos, errores = sembrar_desde_proveedor(ingesta)
+    for symbol, error in errores.items():
+        log.warning("Sin historia para %s (%s): se empieza sin barras cerradas", symbol, error)
+
+    if args.simulado:
+        precios = {s: float(df["Close"].iloc[-1]) for s, df in datos.items() if not df.empty}
+        inicio = max((df.index[-1] for df in datos.values() if not df.empty), default=None)
+        inicio = inicio + pd.Timedelta("1h") if inicio is not None else None
+        ingesta.feed = FeedSimulado(precios, inicio=inicio, velocidad=args.velocidad or None)
+    else:
+        ingesta.feed = FeedYahoo()
+
+    t = time.perf_counter()
+    try:
+        asyncio.run(ingesta.ejecutar(args.segundos))
+    except KeyboardInterrupt:
+        pass
+    segundos = time.perf_counter() - t
+    if notificador is not None:
+        notificador.esperar(timeout=60)
+    if diario is not None:
+        diario.cerrar()
+    e = ingesta.estadisticas
+    print(f"{e['ticks']} ticks en {segundos:.1f}s ({e['ticks'] / max(segundos, 1e-9):,.0f}/s), "
+          f"{e['alertas']} cruces, {e['esperas']} esperas por cola llena, {e['descartados']} fuera de orden")
+    latencia = obtener_metricas().resumen().get("streaming_latencia")
+    if latencia:
+        print(f"latencia tick -> indicadores: p50 {latencia['p50']:.3f} ms, p99 {latencia['p99']:.3f} ms")
+    for symbol, r in ingesta.resumen().items():
+        print(f"{symbols[symbol]}: barra {r['barra']} close {r['close']:.2f} "
+              f"EMA{args.ema_fast} {r['ema_rapida']:.2f} EMA{args.ema_slow} {r['ema_lenta']:.2f} LRS {r['lrs']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ================= CONFIG =================
+# Sesión de futuros CME (metales): de 18:00 a 17:00 hora de Nueva York
+TZ_SESION = "America/New_York"
+INICIO_SESION = pd.Timedelta("18h")
+MARCOS = ("H1", "H4", "D1", "W1")
+# Lo más que puede durar una barra de cada marco (con margen para los cambios de hora y los huecos)
+DURACION_MAXIMA = {"H1": pd.Timedelta("2h"), "H4": pd.Timedelta("5h"), "D1": pd.Timedelta("2D"), "W1": pd.Timedelta("8D")}
+
+
+def etiquetas(indice, marco):
+    """
+    Inicio de la barra `marco` a la que pertenece cada timestamp base.
+
+    Todo se alinea con la apertura de la sesión (18:00 ET, en hora local, así
+    que no se desplaza con el horario de verano): las H4 empiezan a las 18,
+    22, 2, 6, 10 y 14; la D1 lleva la fecha de la sesión (la de las 18:00 del
+    día anterior) y la W1 la del lunes de su semana (abre el domingo a las 18).
+    Las H1/H4 devuelven la zona de la sesión; D1/W1, fechas sin zona.
+    """
+    local = indice.tz_convert(TZ_SESION).tz_localize(None) if indice.tz is not None else indice
+    if marco in ("H1", "H4"):
+        if marco == "H1":
+            inicio = local.floor("h")
+        else:
+            desfase = pd.Timedelta("1D") - INICIO_SESION
+            inicio = (local + desfase).floor("4h") - desfase
+        if indice.tz is None:
+            return inicio
+        return inicio.tz_localize(TZ_SESION, ambiguous=np.ones(len(inicio), dtype=bool),
+                                  nonexistent="shift_forward")
+    sesion = (local + (pd.Timedelta("1D") - INICIO_SESION)).floor("D")
+    if marco == "D1":
+        return sesion
+    if marco == "W1":
+        return sesion - pd.to_timedelta(sesion.dayofweek, unit="D")
+    raise ValueError(f"Marco no soportado: {marco}")
+
+
+def agregar(base, marco):
+    """
+    OHLCV de `marco` a partir de las barras base (ordenadas), en una pasada.
+    Devuelve (barras, inicio) donde `inicio` es el timestamp base con el que
+    empieza la última barra (la que puede estar formándose).
+    """
+    if base.empty:
+        return base.iloc[:0], None
+    lab = etiquetas(base.index, marco)
+    n = len(base)
+    cortes = np.flatnonzero(np.r_[True, lab[1:] != lab[:-1]])
+    finales = np.r_[cortes[1:], n] - 1
+    barras = pd.DataFrame({
+        "Open": base["Open"].to_numpy()[cortes],
+        "High": np.fmax.reduceat(base["High"].to_numpy(), cortes),
+        "Low": np.fmin.reduceat(base["Low"].to_numpy(), cortes),
+        "Close": base["Close"].to_numpy()[finales],
+        "Volume": np.add.reduceat(np.nan_to_num(base["Volume"].to_numpy()), cortes),
+    }, index=lab[cortes])
+    return barras, base.index[cortes[-1]]
+
+
+class RemuestreoSesion:
+    """
+    H1, H4, D1 y W1 de cada símbolo a partir de una sola serie base (1h).
+
+    La primera llamada agrega todo; las siguientes solo vuelven a agregar
+    desde el inicio de la última barra del marco más largo (la semana en
+    curso), así que las barras cerradas no se recalculan. Si los datos
+    recibidos ya no llegan a ese punto se reconstruye todo. Las barras que
+    quedan antes del inicio de la serie base se descartan y la primera se
+    rehace con lo que queda de ella: el resultado es siempre el de agregarlo todo.
+    """
+
+    def __init__(self, marcos=MARCOS):
+        self.marcos = marcos
+        self._lock = threading.Lock()
+        self._simbolos = {}
+
+    def actualizar(self, symbol, base):
+        """Devuelve {marco: DataFrame}; la última barra de cada marco puede estar formándose."""
+        if base is None or base.empty:
+            return None
+        firma = (len(base), base.index[0], base.index[-1], tuple(base.iloc[-1]))
+        with self._lock:
+            estado = self._simbolos.get(symbol)
+            if estado is None or estado["firma"] != firma:
+                if estado is not None and base.index[0] <= estado["desde"] <= base.index[-1]:
+                    estado = self._incremental(estado, base)
+                else:
+                    estado = self._completo(base)
+                estado["firma"] = firma
+                self._simbolos[symbol] = estado
+            return {m: df.copy(deep=False) for m, df in estado["barras"].items()}
+
+    def _completo(self, base):
+        barras, inicios = {}, []
+        for m in self.marcos:
+            barras[m], inicio = agregar(base, m)
+            inicios.append(inicio)
+        return {"barras": barras, "desde": min(inicios)}
+
+    def _incremental(self, estado, base):
+        nuevo = base[base.index >= estado["desde"]]
+        barras, inicios = {}, []
+        for m in self.marcos:
+            parte, inicio = agregar(nuevo, m)
+            viejas = estado["barras"][m]
+            viejas = viejas.iloc[:viejas.index.searchsorted(parte.index[0])]
+            if len(viejas):
+                # La ventana base avanza: fuera las barras que ya no cubre y la primera, parcial, desde la base
+                cabeza = base.iloc[:base.index.searchsorted(base.index[0] + DURACION_MAXIMA[m])]
+                lab = etiquetas(cabeza.index, m)
+                viejas = viejas.iloc[viejas.index.searchsorted(lab[0]):]
+                if len(viejas) and viejas.index[0] == lab[0]:
+                    k = int(np.argmax(lab != lab[0])) or len(lab)
+                    viejas = viejas.copy()
+                    for columna, valor in (("Open", cabeza["Open"].iloc[0]),
+                                           ("High", np.fmax.reduce(cabeza["High"].to_numpy()[:k])),
+                                           ("Low", np.fmin.reduce(cabeza["Low"].to_numpy()[:k])),
+                                           ("Close", cabeza["Close"].iloc[k - 1]),
+                                           ("Volume", np.nan_to_num(cabeza["Volume"].to_numpy()[:k]).sum())):
+                        viejas.iat[0, viejas.columns.get_loc(columna)] = valor
+            barras[m] = pd.concat([viejas, parte])
+            inicios.append(inicio)
+        return {"barras": barras, "desde": min(inicios)}
@@ -0,0 +1,29 @@
+from alertas import NotificadorTelegram
+
+
+class _Respuesta:
+    status_code = 200
+
+
+class _SesionQueFallaUnaVez:
+    def __init__(self):
+        self.textos = []
+
+    def post(self, url, json, timeout):
+        self.textos.append(json["text"])
+        if len(self.textos) == 1:
+            raise RuntimeError("fallo inesperado")
+        return _Respuesta()
+
+
+def test_un_envio_que_falla_no_para_los_siguientes():
+    notificador = NotificadorTelegram("token", espera_base=0, intervalo_chat=0)
+    notificador.sesion = _SesionQueFallaUnaVez()
+    assert notificador.enviar(1, "primero")
+    assert notificador.enviar(1, "segundo")
+    assert notificador.esperar(timeout=5)
+    assert notificador.sesion.textos == ["primero", "segundo"]
+    assert notificador.estadisticas["enviados"] == 1
+    assert notificador.estadisticas["fallidos"] == 1
+    assert "fallo inesperado" in notificador.estadisticas["ultimo_error"]
+    assert notificador._hilo.is_alive()
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import datos
+from datos import COLUMNAS, AlmacenBarras
+
+
+def _barras(n, precio):
+    indice = pd.date_range("2024-01-02", periods=n, freq="1h", tz="America/New_York", unit="ns")
+    return pd.DataFrame({c: np.full(n, precio) for c in COLUMNAS}, index=indice)
+
+
+def test_dos_escritores_no_borran_lo_que_apunta_meta(tmp_path, monkeypatch):
+    # Dashboard y daemon: dos procesos con su propio almacén sobre la misma carpeta
+    dashboard, daemon = AlmacenBarras(str(tmp_path)), AlmacenBarras(str(tmp_path))
+    pid = [1000]
+    monkeypatch.setattr(datos.os, "getpid", lambda: pid[0])
+    reemplazar = os.replace
+    escrito_por_daemon = _barras(30, 2.0)
+
+    def replace_intercalado(origen, destino):
+        reemplazar(origen, destino)
+        # El daemon escribe entre el meta.json del dashboard y su limpieza
+        if destino.endswith("meta.json") and pid[0] == 1000:
+            pid[0] = 2000
+            daemon.guardar("GC=F", "1h", escrito_por_daemon)
+            pid[0] = 1000
+
+    monkeypatch.setattr(datos.os, "replace", replace_intercalado)
+    dashboard.guardar("GC=F", "1h", _barras(20, 1.0))
+    monkeypatch.setattr(datos.os, "replace", reemplazar)
+
+    df, meta = dashboard.leer("GC=F", "1h")
+    assert meta["prefijo"] == "1-2000"
+    pd.testing.assert_frame_equal(df, escrito_por_daemon, check_freq=False)
+
+
+def test_se_limpian_las_generaciones_viejas(tmp_path):
+    almacen = AlmacenBarras(str(tmp_path))
+    for i in range(5):
+        almacen.guardar("GC=F", "1h", _barras(10, float(i)))
+    carpeta = almacen._carpeta("GC=F", "1h")
+    generaciones = {int(n.split("-", 1)[0]) for n in os.listdir(carpeta) if n.endswith(".npy")}
+    assert generaciones == {3, 4}
+    df, _ = almacen.leer("GC=F", "1h")
+    assert (df["Close"] == 4.0).all()
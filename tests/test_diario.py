@@ -0,0 +1,34 @@
+import threading
+
+import pandas as pd
+
+from diario import Diario
+
+
+def test_registrar_senal_anota_cada_cambio_una_vez(tmp_path):
+    ruta = str(tmp_path / "diario.sqlite")
+    # Dashboard y daemon: cada uno con su conexión a la misma base
+    dashboard, daemon = Diario(ruta), Diario(ruta)
+    barra = pd.Timestamp("2024-01-02 18:00", tz="America/New_York")
+    dashboard.registrar_senal("GC=F", barra, "ESPERAR", "p")
+    otro = []
+
+    def intercalar(sql):
+        # El daemon anota el mismo cambio justo cuando el dashboard ya ha leído la última señal
+        if sql.startswith("INSERT") and not otro:
+            hilo = threading.Thread(target=lambda: otro.append(
+                daemon.registrar_senal("GC=F", barra + pd.Timedelta(hours=4), "COMPRAR", "p", origen="daemon")))
+            otro.append(hilo)
+            hilo.start()
+            hilo.join(timeout=0.5)
+
+    dashboard._con.set_trace_callback(intercalar)
+    anotada = dashboard.registrar_senal("GC=F", barra + pd.Timedelta(hours=4, minutes=1), "COMPRAR", "p",
+                                        origen="dashboard")
+    dashboard._con.set_trace_callback(None)
+    otro[0].join()
+
+    assert [anotada, otro[1]].count(True) == 1
+    assert list(dashboard.eventos("GC=F", "señal", "p")["valor"]) == ["ESPERAR", "COMPRAR"]
+    dashboard.cerrar()
+    daemon.cerrar()
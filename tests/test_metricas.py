@@ -0,0 +1,34 @@
+import json
+
+from metricas import ejecucion_aparte, finalizar_ejecucion, iniciar_ejecucion, medir
+
+
+def _registros(ruta):
+    return [json.loads(linea) for linea in ruta.read_text(encoding="utf-8").splitlines()]
+
+
+def test_refresco_de_fragmento_escribe_un_registro(tmp_path):
+    ruta = tmp_path / "metricas.jsonl"
+    # La ejecución completa se cierra antes de que llegue el rerun temporizado del fragmento
+    completa = iniciar_ejecucion()
+    finalizar_ejecucion(completa, ruta_log=str(ruta), ruta_prometheus=None)
+
+    with ejecucion_aparte("fragmento", ruta_log=str(ruta), ruta_prometheus=None):
+        with medir("datos_mercado"):
+            pass
+
+    registros = _registros(ruta)
+    assert len(registros) == 2
+    assert registros[-1]["origen"] == "fragmento"
+    assert [e["etapa"] for e in registros[-1]["etapas"]] == ["datos_mercado"]
+    assert not any(e["etapa"] == "datos_mercado" for e in registros[0]["etapas"])
+
+
+def test_ejecucion_aparte_recupera_la_ejecucion_en_curso(tmp_path):
+    ruta = tmp_path / "metricas.jsonl"
+    completa = iniciar_ejecucion()
+    with ejecucion_aparte("fragmento", ruta_log=str(ruta), ruta_prometheus=None):
+        pass
+    with medir("despues"):
+        pass
+    assert [e[0] for e in completa.etapas] == ["despues"]
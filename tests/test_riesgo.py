@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from riesgo import ruina_exacta, simular_montecarlo
+
+
+@pytest.mark.parametrize("args", [(10000, 500, 1.3, 0.4, 200), (10000, 250, 1.5, 0.45, 1000)])
+def test_montecarlo_coincide_con_ruina_exacta(args):
+    n = 100_000
+    mc = simular_montecarlo(*args, n_paths=n, seed=1)
+    exacta = ruina_exacta(*args)
+    p = exacta["prob_ruina"]
+    assert abs(mc["prob_ruina"] - p) < 5 * np.sqrt(p * (1 - p) / n)
+    assert len(mc["tiempo_ruina"]) == round(mc["prob_ruina"] * n)
+    assert mc["capital_final"][1].sum() == n
+    assert abs(mc["media"][-1] - exacta["media"][-1]) < 0.01 * exacta["media"][-1]
+    # Ruina = drawdown total; el resto, por debajo
+    assert np.count_nonzero(mc["max_drawdown"] >= 1) == len(mc["tiempo_ruina"])
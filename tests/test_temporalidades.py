@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from temporalidades import MARCOS, RemuestreoSesion, agregar
+
+
+def _base(n, seed=0):
+    """Barras de 1h sintéticas en la zona de la sesión, sin fines de semana."""
+    indice = pd.date_range("2024-01-01 18:00", periods=2 * n, freq="1h", tz="America/New_York")
+    indice = indice[indice.dayofweek < 5][:n]
+    rng = np.random.default_rng(seed)
+    cierre = 2000 + np.cumsum(rng.normal(0, 2, len(indice)))
+    return pd.DataFrame({"Open": cierre + rng.normal(0, 1, len(indice)), "High": cierre + 3, "Low": cierre - 3,
+                         "Close": cierre, "Volume": rng.integers(1, 1000, len(indice)).astype(float)}, index=indice)
+
+
+@pytest.mark.parametrize("ventana", [24 * 20, 24 * 120])
+def test_incremental_igual_que_agregar_todo(ventana):
+    serie = _base(ventana + 24 * 40)
+    remuestreo = RemuestreoSesion()
+    # Ventana deslizante como la de la descarga: entran barras por el final y salen por el principio
+    for i in range(0, len(serie) - ventana, 7):
+        base = serie.iloc[i:i + ventana]
+        barras = remuestreo.actualizar("X", base)
+    assert len(barras["H4"]) == len(agregar(base, "H4")[0])
+    for marco in MARCOS:
+        pd.testing.assert_frame_equal(barras[marco], agregar(base, marco)[0])